@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for the uAgents.
+
+One aiohttp session per agent process, opened on the agent's startup event
+and closed on shutdown, so messages reuse keep-alive connections to the
+backend instead of paying DNS, TCP and TLS setup every time.
+
+    AGENT_HTTP_LIMIT           open connections in total (default 32)
+    AGENT_HTTP_LIMIT_PER_HOST  open connections per host (default 16)
+    AGENT_HTTP_KEEPALIVE       seconds an idle connection is kept (default 30)
+    AGENT_HTTP_TIMEOUT         total seconds per request (default 30)
+    AGENT_HTTP_CONNECT_TIMEOUT seconds to establish a connection (default 10)
+    AGENT_MAX_INFLIGHT         handler jobs running at once in the background (default 64)
+    AGENT_MAX_BACKLOG          handler jobs running or waiting to run (default 256)
+
+uAgents awaits message handlers one at a time, so a handler that waits on a
+slow upstream holds up every message queued behind it. Handlers can hand
+their upstream work to run_in_background and return at once. When the
+backlog is full the job is not started and the handler should tell the
+sender, so a burst is pushed back instead of piling up in memory.
+"""
+import asyncio
+import os
+import time
+from typing import Coroutine, Optional, Set
+
+import aiohttp
+from uagents import Agent, Context
+
+AGENT_HTTP_LIMIT = int(os.getenv("AGENT_HTTP_LIMIT", 32))
+AGENT_HTTP_LIMIT_PER_HOST = int(os.getenv("AGENT_HTTP_LIMIT_PER_HOST", 16))
+AGENT_HTTP_KEEPALIVE = float(os.getenv("AGENT_HTTP_KEEPALIVE", 30))
+AGENT_HTTP_TIMEOUT = float(os.getenv("AGENT_HTTP_TIMEOUT", 30))
+AGENT_HTTP_CONNECT_TIMEOUT = float(os.getenv("AGENT_HTTP_CONNECT_TIMEOUT", 10))
+AGENT_MAX_INFLIGHT = int(os.getenv("AGENT_MAX_INFLIGHT", 64))
+AGENT_MAX_BACKLOG = int(os.getenv("AGENT_MAX_BACKLOG", 256))
+
+_session: Optional[aiohttp.ClientSession] = None
+_background: Set[asyncio.Task] = set()
+_inflight: Optional[asyncio.Semaphore] = None
+
+
+def create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=AGENT_HTTP_LIMIT,
+        limit_per_host=AGENT_HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=AGENT_HTTP_KEEPALIVE,
+        ttl_dns_cache=300,
+    )
+    timeout = aiohttp.ClientTimeout(total=AGENT_HTTP_TIMEOUT, sock_connect=AGENT_HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_session() -> aiohttp.ClientSession:
+    """The process-wide session, created on first use if startup has not run yet."""
+    global _session
+    if _session is None or _session.closed:
+        _session = create_session()
+    return _session
+
+
+def run_in_background(ctx: Context, job: Coroutine) -> bool:
+    """
+    Run a handler's upstream work as a task, at most AGENT_MAX_INFLIGHT at a
+    time. Returns False, without starting it, when AGENT_MAX_BACKLOG jobs are
+    already running or waiting.
+    """
+    global _inflight
+    if len(_background) >= AGENT_MAX_BACKLOG:
+        # Never awaited; close it so Python does not warn about it
+        job.close()
+        return False
+    if _inflight is None:
+        _inflight = asyncio.Semaphore(AGENT_MAX_INFLIGHT)
+
+    async def run():
+        async with _inflight:
+            try:
+                await job
+            except Exception as e:
+                ctx.logger.error(f"Background job failed: {e}")
+
+    task = asyncio.create_task(run())
+    # Hold a reference until it finishes so the task is not garbage collected mid-flight
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return True
+
+
+async def drain_background(timeout: Optional[float] = None) -> None:
+    if _background:
+        await asyncio.wait(set(_background), timeout=timeout)
+
+
+async def close_session() -> None:
+    global _session
+    await drain_background(timeout=AGENT_HTTP_TIMEOUT)
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def install(agent: Agent) -> None:
+    """Open the shared session when the agent starts and close it when it stops."""
+
+    @agent.on_event("startup")
+    async def open_http_session(ctx: Context):
+        get_session()
+
+    @agent.on_event("shutdown")
+    async def close_http_session(ctx: Context):
+        await close_session()
+
+
+class RateLimiter:
+    """Spaces requests at least 1/rate seconds apart across every caller in the process."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Benchmarks against a local stub backend:
+#   --mode connections  connections opened per 1000 text_agent messages
+#   --mode latency      stripe_agent message throughput when the backend takes --latency seconds
+if __name__ == "__main__":
+    import argparse
+    import logging
+    import threading
+    from types import SimpleNamespace
+
+    import requests
+    from aiohttp import web
+
+    arg_parser = argparse.ArgumentParser(description="Agent HTTP client benchmarks")
+    arg_parser.add_argument("--mode", choices=("connections", "latency"), default="connections")
+    arg_parser.add_argument("--messages", type=int, default=1000)
+    arg_parser.add_argument("--latency", type=float, default=2.0, help="upstream delay in --mode latency")
+    arg_parser.add_argument("--port", type=int, default=8766)
+    args = arg_parser.parse_args()
+
+    path = "/send-message" if args.mode == "connections" else "/charge"
+    os.environ["API_URL"] = f"http://127.0.0.1:{args.port}{path}"
+    connections = set()
+
+    async def stub_backend(request: web.Request) -> web.Response:
+        connections.add(request.transport.get_extra_info("peername"))
+        await request.json()
+        if args.mode == "latency":
+            await asyncio.sleep(args.latency)
+        # Shaped like the real endpoints: /charge returns the whole PaymentIntent object
+        return web.json_response({"message": "Message sent", "success": True, "payment_intent": {
+            "id": "pi_test", "object": "payment_intent", "amount": 1000, "currency": "usd", "status": "succeeded",
+        }})
+
+    def serve_stub() -> None:
+        # Own thread and loop, so the blocking baseline cannot stall the stub
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_post(path, stub_backend)
+        runner = web.AppRunner(app, access_log=None)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", args.port).start())
+        loop.run_forever()
+
+    threading.Thread(target=serve_stub, daemon=True).start()
+    time.sleep(0.5)
+
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.ERROR)
+    replies = []
+
+    async def send(destination, message):
+        replies.append(message)
+
+    ctx = SimpleNamespace(logger=logger, send=send)
+
+    async def connections_benchmark() -> None:
+        import text_agent
+
+        req = text_agent.CallRequest(phone_number="+15555550100", task="Make the bed", time_remaining="1 hour")
+
+        async def per_message_session():
+            async with aiohttp.ClientSession() as session:
+                async with session.post(text_agent.api_url, json=req.dict()) as response:
+                    await response.json()
+
+        for label, send in (("session per message", per_message_session),
+                            ("shared agent session", lambda: text_agent.send_message(ctx, "bench", req))):
+            connections.clear()
+            start = time.perf_counter()
+            for _ in range(args.messages):
+                await send()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<22} {len(connections):>5} connections / {args.messages} messages, "
+                  f"{args.messages / elapsed:7.0f} msg/s")
+
+        # text_agent imported this file as agent_http, not __main__
+        await text_agent.agent_http.close_session()
+
+    async def latency_benchmark() -> None:
+        import stripe_agent
+
+        req = stripe_agent.StripeChargeRequest(email="user@example.com")
+
+        async def blocking_handler(ctx, sender, req):
+            # The previous handler body: a synchronous requests.post inside async def
+            result = requests.post(stripe_agent.api_url, json={"email": req.email}).json()
+            await ctx.send(sender, stripe_agent.StripeChargeResult(email=req.email, success=result["success"]))
+
+        # uAgents awaits one handler at a time, so dispatch the same way
+        for label, handler, messages in (("blocking requests", blocking_handler, min(args.messages, 5)),
+                                         ("async + background", stripe_agent.handle_charge, args.messages)):
+            replies.clear()
+            start = time.perf_counter()
+            for _ in range(messages):
+                await handler(ctx, "bench", req)
+            dispatched = time.perf_counter() - start
+            await stripe_agent.agent_http.drain_background()
+            elapsed = time.perf_counter() - start
+            charged = sum(1 for reply in replies if reply.success)
+            rejected = sum(1 for reply in replies if "busy" in reply.error)
+            print(f"{label:<20} {messages:>5} messages: handlers returned in {dispatched:6.2f}s, "
+                  f"all done in {elapsed:6.2f}s, {charged / elapsed:7.2f} charges/s, "
+                  f"{charged} charged, {rejected} rejected as busy (backlog cap {AGENT_MAX_BACKLOG})")
+
+        await stripe_agent.agent_http.close_session()
+
+    asyncio.run(connections_benchmark() if args.mode == "connections" else latency_benchmark())
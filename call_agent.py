@@ -1,68 +1,58 @@
 """
-This agent attempts to book a restaurant table by sending requests
+This agent places a phone call reminder for each CallRequest it receives
 """
 
 import os
-import asyncio
-import aiohttp
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from uagents import Agent, Context, Model
-from pydantic import Field
+import agent_http
 
 load_dotenv()
 
 class CallRequest(Model):
-    phone_number: str = Field(default="+16476872539")  # Placeholder number
-    task: str = Field(default="Complete your project")  # Placeholder task
-    time_remaining: str = Field()
+    phone_number: str = "+16476872539"  # Placeholder number
+    task: str = "Complete your project"  # Placeholder task
+    time_remaining: str = ""  # e.g. "10 minutes", from the sender's threshold
 
 # Initialize agent
 agent = Agent()
+agent_http.install(agent)
 
 # Configuration
-api_url = os.getenv('API_URL', f'{os.getenv('NGROK_URL')}/make-call')
-start_time = datetime.now()
-end_time = start_time + timedelta(hours=1)  # 1 hour timer
+api_url = os.getenv('API_URL', f"{os.getenv('NGROK_URL')}/make-call")
+CALLS_PER_MINUTE = float(os.getenv('CALLS_PER_MINUTE', 30))  # Across all numbers
+
+call_limiter = agent_http.RateLimiter(CALLS_PER_MINUTE / 60)
 
 @agent.on_event("startup")
 async def startup(ctx: Context):
-    """Initialize the agent and start the timer"""
+    """Initialize the agent; calls are only placed for incoming CallRequests"""
     ctx.logger.info("Call agent started")
-    await make_call(ctx)
 
 @agent.on_message(model=CallRequest, replies=set())
-async def make_call(ctx: Context, msg: CallRequest):
-    """Make a call using the OpenAI endpoint"""
-    while True:
-        time_left = end_time - datetime.now()
-        if time_left.total_seconds() <= 0:
-            ctx.logger.info("Timer expired")
-            break
-
-        # Format time remaining
-        hours = int(time_left.total_seconds() // 3600)
-        minutes = int((time_left.total_seconds() % 3600) // 60)
-        time_remaining = f"{hours} hours and {minutes} minutes"
-
-        # Create call request
-        request_data = {
-            "phone_number": CallRequest.phone_number,
-            "task": CallRequest.task,
-            "time_remaining": CallRequest.time_remaining
-        }
-
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(api_url, json=request_data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        ctx.logger.info(f"Call initiated with SID: {result.get('call_sid')}")
-                    else:
-                        ctx.logger.error(f"Failed to make call: {response.status}")
-        except Exception as e:
-            ctx.logger.error(f"Error making call: {e}")
+async def make_call(ctx: Context, sender: str, msg: CallRequest):
+    """Place one call per request; the sender decides when and how often to call"""
+    if not agent_http.run_in_background(ctx, place_call(ctx, msg)):
+        ctx.logger.warning(f"Too many calls in flight, dropping call to {msg.phone_number}")
+
+async def place_call(ctx: Context, req: CallRequest):
+    """Ask the backend to make the call, spaced out by CALLS_PER_MINUTE."""
+    request_data = {
+        "phone_number": req.phone_number,
+        "task": req.task,
+        "time_remaining": req.time_remaining
+    }
+
+    await call_limiter.wait()
+    try:
+        async with agent_http.get_session().post(api_url, json=request_data) as response:
+            if response.status == 200:
+                result = await response.json()
+                ctx.logger.info(f"Call initiated with SID: {result.get('call_sid')}")
+            else:
+                ctx.logger.error(f"Failed to make call: {response.status}")
+    except Exception as e:
+        ctx.logger.error(f"Error making call: {e}")
 
 if __name__ == "__main__":
-    agent.run()    
-    
\ No newline at end of file
+    agent.run()
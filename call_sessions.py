@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Per-call state for concurrent voice calls in backend.py.
+
+/make-call registers a session holding that call's prompt and passes the
+session key through the TwiML stream as a custom parameter. Twilio echoes it
+back in the media stream's "start" message, so each websocket picks up its
+own prompt no matter how many calls are in flight. Sessions are also indexed
+by call SID once Twilio returns it, and expire after CALL_SESSION_TTL seconds
+if the call is never answered or never hangs up cleanly.
+
+    CALL_SESSION_TTL    seconds a session stays valid (default 900)
+"""
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+CALL_SESSION_TTL = float(os.getenv("CALL_SESSION_TTL", 900))
+
+
+class CallSession:
+    def __init__(self, key: str, system_prompt: str, expires_at: float):
+        self.key = key
+        self.system_prompt = system_prompt
+        self.expires_at = expires_at
+        self.call_sid: Optional[str] = None
+        self.stream_sid: Optional[str] = None
+
+
+class CallSessionRegistry:
+    def __init__(self, ttl: float = CALL_SESSION_TTL):
+        self.ttl = ttl
+        # Insertion order is expiry order since every session gets the same TTL
+        self._sessions: "OrderedDict[str, CallSession]" = OrderedDict()
+        self._by_call_sid: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, system_prompt: str) -> CallSession:
+        self.purge_expired()
+        session = CallSession(secrets.token_urlsafe(16), system_prompt, time.monotonic() + self.ttl)
+        self._sessions[session.key] = session
+        return session
+
+    def attach_call(self, key: str, call_sid: str) -> None:
+        session = self._sessions.get(key)
+        if session is not None:
+            session.call_sid = call_sid
+            self._by_call_sid[call_sid] = key
+
+    def get(self, key: Optional[str] = None, call_sid: Optional[str] = None) -> Optional[CallSession]:
+        """Find a live session by session key, falling back to the Twilio call SID."""
+        if key is None and call_sid is not None:
+            key = self._by_call_sid.get(call_sid)
+        session = self._sessions.get(key) if key is not None else None
+        if session is None:
+            return None
+        if session.expires_at <= time.monotonic():
+            self.remove(session.key)
+            return None
+        return session
+
+    def remove(self, key: str) -> None:
+        session = self._sessions.pop(key, None)
+        if session is not None and session.call_sid is not None:
+            self._by_call_sid.pop(session.call_sid, None)
+
+    def purge_expired(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.expires_at > now:
+                break
+            self.remove(key)
+
+
+# Concurrency check: many simultaneous calls through backend.py against fake
+# Twilio and OpenAI servers, verifying each OpenAI session gets its own prompt.
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import json
+    import re
+    import sys
+    from types import SimpleNamespace
+
+    import aiohttp
+    import uvicorn
+    from aiohttp import web
+
+    arg_parser = argparse.ArgumentParser(description="Concurrent call session check for backend.py")
+    arg_parser.add_argument("--calls", type=int, default=300)
+    arg_parser.add_argument("--port", type=int, default=5061)
+    arg_parser.add_argument("--openai-port", type=int, default=5062)
+    args = arg_parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACtest")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "test")
+    os.environ.setdefault("TWILIO_PHONE_NUMBER", "+15555550100")
+    os.environ["NGROK_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["OPENAI_REALTIME_URL"] = f"ws://127.0.0.1:{args.openai_port}/v1/realtime"
+    import backend
+
+    instructions: Dict[str, str] = {}  # stream SID -> prompt the fake OpenAI received
+
+    async def fake_openai(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            event = json.loads(msg.data)
+            if event["type"] == "session.update":
+                prompt = event["session"]["instructions"]
+                stream_sid = re.search(r"stream (MZ\d+)", prompt).group(1)
+                instructions[stream_sid] = prompt
+                await ws.send_str(json.dumps({"type": "response.audio.delta", "delta": "AAAA"}))
+        return ws
+
+    created_calls = []
+
+    class FakeCalls:
+        counter = 0
+
+        def create(self, url, to, from_):
+            FakeCalls.counter += 1
+            created_calls.append((url, to))
+            return SimpleNamespace(sid=f"CA{FakeCalls.counter}")
+
+    async def fake_twilio_call(session: aiohttp.ClientSession, index: int) -> bool:
+        """Place a call, fetch its TwiML like Twilio would, then stream media for it."""
+        stream_sid = f"MZ{index}"
+        async with session.post(f"http://127.0.0.1:{args.port}/make-call", json={
+            "phone_number": f"+1555{index:07d}", "task": f"task for stream {stream_sid}",
+            "time_remaining": "1 hour",
+        }) as resp:
+            call_sid = (await resp.json())["call_sid"]
+        twiml_url = next(url for url, to in created_calls if to == f"+1555{index:07d}")
+        async with session.post(twiml_url) as resp:
+            twiml = await resp.text()
+        stream_url = re.search(r'url="([^"]+)"', twiml).group(1).replace("wss://", "ws://")
+        stream_url = stream_url.replace("127.0.0.1/", f"127.0.0.1:{args.port}/")
+        params = dict(re.findall(r'<Parameter name="([^"]+)" value="([^"]+)"', twiml))
+        async with session.ws_connect(stream_url) as ws:
+            await ws.send_str(json.dumps({"event": "start", "start": {
+                "streamSid": stream_sid, "callSid": call_sid, "customParameters": params,
+            }}))
+            await ws.receive(timeout=10)  # first audio frame from the fake model
+        return stream_sid in instructions[stream_sid]
+
+    async def run() -> None:
+        openai_app = web.Application()
+        openai_app.router.add_get("/v1/realtime", fake_openai)
+        runner = web.AppRunner(openai_app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.openai_port).start()
+
+        server = uvicorn.Server(uvicorn.Config(backend.app, port=args.port, log_level="warning"))
+        serve = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        backend.app.state.providers.twilio = SimpleNamespace(calls=FakeCalls())
+
+        start = time.perf_counter()
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            results = await asyncio.gather(*(fake_twilio_call(session, i) for i in range(args.calls)))
+        elapsed = time.perf_counter() - start
+
+        server.should_exit = True
+        await serve
+        await runner.cleanup()
+        print(f"{args.calls} concurrent calls in {elapsed:.2f}s, "
+              f"{sum(results)} with the correct prompt, {len(backend.call_sessions)} sessions left open")
+        if not all(results):
+            sys.exit(1)
+
+    asyncio.run(run())
@@ -0,0 +1,143 @@
+"""
+Read-through cache of the charities collection.
+
+The charity list almost never changes but is read on every app load, every
+task creation and every donation run. The cache keeps one snapshot of the
+collection: documents by _id, the serialized /charities body and its ETag.
+The snapshot is reloaded when it is older than CHARITY_CACHE_TTL or after a
+write through `invalidate`. Concurrent misses share a single reload.
+
+With several app workers, set CHARITY_CACHE_SIGNAL=true. `invalidate` then
+also bumps a version document in `cache_versions`, and every worker checks
+that version at most every CHARITY_CACHE_SIGNAL_INTERVAL seconds, so an
+insert shows up everywhere well before the TTL.
+
+    CHARITY_CACHE_TTL              seconds a snapshot is served (default 300)
+    CHARITY_CACHE_SIGNAL           "true" to share invalidations across workers
+    CHARITY_CACHE_SIGNAL_INTERVAL  seconds between version checks (default 5)
+"""
+import asyncio
+import hashlib
+import os
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+import orjson
+from bson import ObjectId
+
+CHARITY_CACHE_TTL = float(os.getenv("CHARITY_CACHE_TTL", 300))
+CHARITY_CACHE_SIGNAL = os.getenv("CHARITY_CACHE_SIGNAL", "false").lower() == "true"
+CHARITY_CACHE_SIGNAL_INTERVAL = float(os.getenv("CHARITY_CACHE_SIGNAL_INTERVAL", 5))
+
+# Fields kept per charity; /charities only exposes _id and name
+CHARITY_PROJECTION = {"name": 1, "stripe_account_id": 1}
+
+# Unknown ids trigger a reload (the charity may have just been added elsewhere), at most this often
+MISS_RELOAD_INTERVAL = 1.0
+
+
+class CharitySnapshot(NamedTuple):
+    by_id: Dict[ObjectId, Dict[str, Any]]
+    body: bytes  # JSON list of {"_id", "name"} for /charities
+    etag: str
+    loaded_at: float
+
+
+class CharityCache:
+    def __init__(self, db: Any, ttl: float = CHARITY_CACHE_TTL, signal: bool = CHARITY_CACHE_SIGNAL,
+                 signal_interval: float = CHARITY_CACHE_SIGNAL_INTERVAL):
+        self.db = db
+        self.ttl = ttl
+        self.signal = signal
+        self.signal_interval = signal_interval
+        self._snapshot: Optional[CharitySnapshot] = None
+        self._lock = asyncio.Lock()
+        # Bumped by invalidate, so a reload that raced a write is not kept
+        self._generation = 0
+        self._version: Optional[int] = None
+        self._version_checked = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.invalidations = 0
+        self.not_modified = 0
+
+    async def _remote_version(self) -> int:
+        doc = await self.db.cache_versions.find_one({"_id": "charities"}, {"version": 1})
+        return doc["version"] if doc else 0
+
+    async def _stale(self, snapshot: Optional[CharitySnapshot]) -> bool:
+        now = time.monotonic()
+        if snapshot is None or now - snapshot.loaded_at >= self.ttl:
+            return True
+        if self.signal and now - self._version_checked >= self.signal_interval:
+            self._version_checked = now
+            version = await self._remote_version()
+            if version != self._version:
+                self._version = version
+                return True
+        return False
+
+    async def _reload(self, seen: Optional[CharitySnapshot]) -> CharitySnapshot:
+        async with self._lock:
+            # Another caller may have reloaded while we waited for the lock
+            if self._snapshot is not seen and self._snapshot is not None:
+                return self._snapshot
+            if self.signal:
+                self._version = await self._remote_version()
+                self._version_checked = time.monotonic()
+            generation = self._generation
+            charities = await self.db.charities.find({}, CHARITY_PROJECTION).to_list(None)
+            body = orjson.dumps([{"_id": str(c["_id"]), "name": c.get("name")} for c in charities])
+            etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+            snapshot = CharitySnapshot({c["_id"]: c for c in charities}, body, etag, time.monotonic())
+            if generation == self._generation:
+                self._snapshot = snapshot
+            self.reloads += 1
+            return snapshot
+
+    async def snapshot(self) -> CharitySnapshot:
+        snapshot = self._snapshot
+        if await self._stale(snapshot):
+            self.misses += 1
+            return await self._reload(snapshot)
+        self.hits += 1
+        return snapshot
+
+    async def get(self, charity_id: ObjectId) -> Optional[Dict[str, Any]]:
+        snapshot = await self.snapshot()
+        charity = snapshot.by_id.get(charity_id)
+        if charity is None and time.monotonic() - snapshot.loaded_at >= MISS_RELOAD_INTERVAL:
+            charity = (await self._reload(snapshot)).by_id.get(charity_id)
+        return charity
+
+    async def invalidate(self) -> None:
+        """Drop the snapshot after a write, and tell other workers to do the same."""
+        self._snapshot = None
+        self._generation += 1
+        self.invalidations += 1
+        if self.signal:
+            await self.db.cache_versions.update_one({"_id": "charities"}, {"$inc": {"version": 1}}, upsert=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "charities": len(self._snapshot.by_id) if self._snapshot else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "reloads": self.reloads,
+            "invalidations": self.invalidations,
+            "not_modified": self.not_modified,
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when an If-None-Match header names this ETag (weak or strong) or is *."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,73 @@
+"""
+Async MongoDB access shared by the FastAPI app, background jobs and agents.
+
+Uses PyMongo's native asyncio client so queries never block the event loop.
+Pool sizing is tunable through the environment:
+
+    MONGO_MAX_POOL_SIZE   connections per client (default 100)
+    MONGO_MIN_POOL_SIZE   connections kept warm (default 0)
+    MONGO_TIMEOUT_MS      server selection / socket timeout (default 10000)
+    MONGO_TLS             set to "false" for a local mongod without TLS
+
+Every client reports command timings to observability.py.
+"""
+import os
+from typing import Any, Optional
+
+import certifi
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+from observability import MongoCommandMetrics
+from task_store import TaskStore
+
+load_dotenv()
+MONGO_URL = os.getenv("MONGO_URL")
+MONGO_DBNAME = os.getenv("MONGO_DB", "lahacks25")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 10000))
+MONGO_TLS = os.getenv("MONGO_TLS", "true").lower() != "false"
+
+_client: Optional[AsyncMongoClient] = None
+_command_metrics = MongoCommandMetrics()
+_task_store: Optional[TaskStore] = None
+
+
+def create_client(url: Optional[str] = None, **kwargs: Any) -> AsyncMongoClient:
+    """Build an async client with the configured pool settings. Does no I/O."""
+    kwargs.setdefault("maxPoolSize", MONGO_MAX_POOL_SIZE)
+    kwargs.setdefault("minPoolSize", MONGO_MIN_POOL_SIZE)
+    kwargs.setdefault("serverSelectionTimeoutMS", MONGO_TIMEOUT_MS)
+    kwargs.setdefault("socketTimeoutMS", MONGO_TIMEOUT_MS)
+    kwargs.setdefault("event_listeners", [_command_metrics])
+    if MONGO_TLS:
+        kwargs.setdefault("tls", True)
+        kwargs.setdefault("tlsCAFile", certifi.where())
+    return AsyncMongoClient(url or MONGO_URL, **kwargs)
+
+
+def get_client() -> AsyncMongoClient:
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+
+def get_db() -> Any:
+    return get_client()[MONGO_DBNAME]
+
+
+def get_task_store() -> TaskStore:
+    global _task_store
+    if _task_store is None:
+        _task_store = TaskStore(get_db())
+    return _task_store
+
+
+async def close() -> None:
+    global _client, _task_store
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _task_store = None
@@ -0,0 +1,68 @@
+"""
+Donation pass for undone tasks.
+
+One run costs a fixed number of round-trips: one charities query (skipped
+when the caller passes the cached charities) and one aggregation cursor over
+the pending tasks, plus its getMore batches. Pending tasks already have
+did_task=False, so the pass writes nothing back.
+"""
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+
+from observability import fields
+from task_store import TaskStore
+
+log = logging.getLogger(__name__)
+
+
+async def load_charities(db: Any) -> Dict[ObjectId, Dict[str, Any]]:
+    cursor = db.charities.find({}, {"name": 1, "stripe_account_id": 1})
+    return {c["_id"]: c async for c in cursor}
+
+
+async def run_donation_pass(db: Any, store: TaskStore, batch_size: int = 1000,
+                            charities: Optional[Dict[ObjectId, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Donate for every pending task.
+
+    Pass `charities` (e.g. from the charity cache) to skip the charities query.
+
+    Returns:
+        dict: Per-run counts and phase timings in milliseconds
+    """
+    stats: Dict[str, Any] = {
+        "tasks": 0,
+        "donations": 0,
+        "missing_charity": 0,
+        "errors": 0,
+    }
+    start = time.perf_counter()
+
+    if charities is None:
+        charities = await load_charities(db)
+    stats["charities_ms"] = (time.perf_counter() - start) * 1000
+
+    async for user, task in store.iter_pending(batch_size=batch_size):
+        stats["tasks"] += 1
+
+        # TODO: implement frequency logic based on task['frequency'] and task['due_date']
+
+        c = charities.get(task.get("charity_id"))
+        if not c:
+            stats["missing_charity"] += 1
+            continue
+        try:
+            log.info("Donating $%.2f to %s", task['donation_amount'] / 100, c['name'],
+                     extra=fields(user_id=user["_id"], task_id=task["_id"], charity_id=c["_id"],
+                                  amount_cents=task['donation_amount']))
+            stats["donations"] += 1
+        except Exception:
+            stats["errors"] += 1
+            log.exception("Error donating", extra=fields(user_id=user["_id"], task_id=task["_id"]))
+
+    stats["total_ms"] = (time.perf_counter() - start) * 1000
+    stats["scan_ms"] = stats["total_ms"] - stats["charities_ms"]
+    return stats
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Non-blocking Gemini client for photo verification.
+
+Talks to the generateContent REST endpoint over a shared aiohttp session
+instead of the blocking SDK call, so verifications from concurrent users
+overlap instead of queueing behind each other.
+
+    GEMINI_API_KEY / GEMINI_API_KEYS  one key, or a comma-separated list to spread load
+    GEMINI_API_BASE         endpoint root (point at a local fake server for testing)
+    GEMINI_MODEL            model name (default gemini-1.5-flash)
+    GEMINI_MAX_CONCURRENCY  in-flight requests per process (default 16)
+    GEMINI_RATE_PER_KEY     sustained requests per second per key (default 5)
+    GEMINI_BURST            burst size per key (default 10)
+    GEMINI_TIMEOUT          seconds per attempt (default 30)
+    GEMINI_RETRIES          extra attempts on 429/5xx/timeouts (default 3)
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+from observability import track
+
+load_dotenv()
+GEMINI_API_KEYS = [k.strip() for k in os.getenv("GEMINI_API_KEYS", os.getenv("GEMINI_API_KEY") or "").split(",") if k.strip()]
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+GEMINI_RATE_PER_KEY = float(os.getenv("GEMINI_RATE_PER_KEY", 5))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", 10))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 30))
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", 3))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+class _SharedCall:
+    """One upstream call and the number of callers awaiting it."""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        api_keys: Optional[List[str]] = None,
+        api_base: str = GEMINI_API_BASE,
+        model: str = GEMINI_MODEL,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        rate_per_key: float = GEMINI_RATE_PER_KEY,
+        burst: int = GEMINI_BURST,
+        timeout: float = GEMINI_TIMEOUT,
+        retries: int = GEMINI_RETRIES,
+    ):
+        self.api_keys = api_keys if api_keys is not None else GEMINI_API_KEYS
+        if not self.api_keys:
+            raise GeminiError("No Gemini API key configured")
+        self.url = f"{api_base.rstrip('/')}/v1beta/models/{model}:generateContent"
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets = {key: TokenBucket(rate_per_key, burst) for key in self.api_keys}
+        self._bucket_lock = asyncio.Lock()
+        self._inflight: Dict[str, _SharedCall] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.coalesced = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _acquire_key(self) -> str:
+        """Wait for the key whose rate limit frees up first and spend one token."""
+        async with self._bucket_lock:
+            while True:
+                key = min(self.api_keys, key=lambda k: self._buckets[k].wait_time())
+                delay = self._buckets[key].wait_time()
+                if delay <= 0:
+                    self._buckets[key].take()
+                    return key
+                await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str, image: bytes, mime_type: str,
+                       generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Ask the model about one image and return the response text.
+
+        Identical requests already in flight share a single upstream call. The
+        call runs in its own task, so a caller that is cancelled (e.g. its
+        client disconnected) only stops waiting; the call itself is cancelled
+        once no caller is left.
+        """
+        digest = hashlib.sha256()
+        digest.update(prompt.encode("utf-8"))
+        digest.update(mime_type.encode("utf-8"))
+        digest.update(image)
+        digest.update(repr(sorted((generation_config or {}).items())).encode("utf-8"))
+        key = digest.hexdigest()
+
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = _SharedCall(asyncio.create_task(
+                self._generate(prompt, image, mime_type, generation_config or {})))
+            self._inflight[key] = shared
+            shared.task.add_done_callback(lambda task: self._call_done(key, shared))
+        else:
+            self.coalesced += 1
+
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.waiters -= 1
+            if shared.waiters == 0 and not shared.task.done():
+                shared.task.cancel()
+
+    def _call_done(self, key: str, shared: _SharedCall) -> None:
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+        # Mark the exception retrieved if every caller was cancelled before it arrived
+        if not shared.task.cancelled():
+            shared.task.exception()
+
+    async def _generate(self, prompt: str, image: bytes, mime_type: str,
+                        generation_config: Dict[str, Any]) -> str:
+        body = {
+            "contents": [{
+                "role": "user",
+                "parts": [
+                    {"text": prompt},
+                    {"inline_data": {"mime_type": mime_type, "data": base64.b64encode(image).decode("ascii")}},
+                ],
+            }],
+            "generationConfig": generation_config,
+        }
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                api_key = await self._acquire_key()
+                try:
+                    # Raised inside track() so non-200 attempts are timed as errors
+                    with track("gemini", "generate_content"):
+                        async with self._get_session().post(self.url, params={"key": api_key}, json=body) as resp:
+                            if resp.status == 200:
+                                return self._extract_text(await resp.json())
+                            detail = await resp.text()
+                            raise GeminiError(f"Gemini returned {resp.status}: {detail[:200]}")
+                except GeminiError:
+                    if resp.status not in RETRY_STATUSES or attempt == self.retries:
+                        raise
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == self.retries:
+                        raise GeminiError(f"Gemini request failed: {e!r}") from e
+                # Full jitter exponential backoff
+                await asyncio.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+        raise GeminiError("Gemini request failed")
+
+    @staticmethod
+    def _extract_text(payload: Dict[str, Any]) -> str:
+        try:
+            parts = payload["candidates"][0]["content"]["parts"]
+            return "".join(part.get("text", "") for part in parts)
+        except (KeyError, IndexError, TypeError):
+            raise GeminiError(f"Invalid response format from Gemini API: {str(payload)[:200]}")
+
+
+_client: Optional[GeminiClient] = None
+
+
+def get_gemini_client() -> GeminiClient:
+    global _client
+    if _client is None:
+        _client = GeminiClient()
+    return _client
+
+
+async def close_gemini_client() -> None:
+    if _client is not None:
+        await _client.close()
+
+
+# Fake Gemini server + concurrency check: throughput should scale with concurrent users
+if __name__ == "__main__":
+    import argparse
+
+    from aiohttp import web
+
+    arg_parser = argparse.ArgumentParser(description="Run verifications against a local fake Gemini server")
+    arg_parser.add_argument("--latency", type=float, default=0.5, help="fake model latency in seconds")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    args = arg_parser.parse_args()
+
+    async def fake_generate(request: web.Request) -> web.Response:
+        await request.json()
+        await asyncio.sleep(args.latency)
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": "YES"}]}}]})
+
+    async def run() -> None:
+        app = web.Application()
+        app.router.add_post("/v1beta/models/{model}", fake_generate)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+        client = GeminiClient(api_keys=["fake"], api_base=f"http://127.0.0.1:{args.port}",
+                              rate_per_key=1000, burst=1000)
+        print(f"{'users':>6} {'elapsed s':>10} {'req/s':>8}")
+        for users in (1, 4, 16, 64):
+            start = time.perf_counter()
+            await asyncio.gather(*(client.generate("Is the bed made?", os.urandom(32), "image/jpeg")
+                                   for _ in range(users)))
+            elapsed = time.perf_counter() - start
+            print(f"{users:>6} {elapsed:>10.2f} {users / elapsed:>8.1f}")
+
+        photo = os.urandom(32)
+        await asyncio.gather(*(client.generate("Is the bed made?", photo, "image/jpeg") for _ in range(10)))
+        print(f"coalesced {client.coalesced} of 10 identical requests")
+
+        # The first caller disconnecting must not fail the requests coalesced onto it
+        photo = os.urandom(32)
+        callers = [asyncio.create_task(client.generate("Is the bed made?", photo, "image/jpeg")) for _ in range(5)]
+        await asyncio.sleep(args.latency / 2)
+        callers[0].cancel()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        survived = sum(1 for result in results[1:] if result == "YES")
+        print(f"first caller cancelled: {survived} of {len(callers) - 1} coalesced callers still got a result")
+
+        await client.close()
+        await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Shrink verification photos before they are sent to Gemini.
+
+Phone photos are several megabytes; the model only needs a modest resolution
+to judge task completion. Each upload is decoded once, rotated according to
+its EXIF orientation, downscaled to IMAGE_MAX_EDGE and re-encoded.
+
+    IMAGE_MAX_EDGE      longest edge in pixels (default 1024)
+    IMAGE_QUALITY       JPEG/WebP quality (default 80)
+    IMAGE_FORMAT        JPEG or WEBP (default JPEG)
+"""
+import asyncio
+import io
+import os
+from typing import BinaryIO, Tuple, Union
+
+from fastapi import HTTPException
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1024))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+
+# EXIF tag holding the camera orientation
+EXIF_ORIENTATION = 0x0112
+
+
+def detect_format(data: bytes) -> str:
+    """Return the MIME type of an encoded image, e.g. "image/png"."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return Image.MIME.get(img.format or "", "application/octet-stream")
+    except Exception as e:
+        raise HTTPException(400, f"Invalid image format: {str(e)}")
+
+
+def preprocess_image(
+    data: Union[bytes, BinaryIO],
+    max_edge: int = IMAGE_MAX_EDGE,
+    quality: int = IMAGE_QUALITY,
+    fmt: str = IMAGE_FORMAT,
+) -> Tuple[bytes, str]:
+    """
+    Normalize an uploaded image for model verification.
+
+    Args:
+        data: Encoded image bytes in any format Pillow can read, or an open
+            binary file (e.g. an upload's spooled temp file), read in place
+        max_edge: Longest edge of the output in pixels
+        quality: Encoder quality for JPEG/WebP
+        fmt: Output format, "JPEG" or "WEBP"
+
+    Returns:
+        tuple: (encoded bytes, MIME type). Small images that already match the
+        target format and orientation are returned unchanged.
+
+    Raises:
+        HTTPException: If the bytes are not a readable image
+    """
+    # Pillow is imported on first use so importing the app stays fast
+    from PIL import Image, ImageOps
+
+    try:
+        is_file = hasattr(data, "read")
+        img = Image.open(data if is_file else io.BytesIO(data))
+        source_format = img.format
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+
+        if source_format == fmt and orientation == 1 and max(img.size) <= max_edge:
+            if is_file:
+                data.seek(0)
+                data = data.read()
+            return data, Image.MIME[fmt]
+
+        # Let the JPEG decoder skip straight to a nearby power-of-two scale
+        if source_format == "JPEG":
+            img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    except Exception as e:
+        raise HTTPException(400, f"Invalid image format: {str(e)}")
+
+    out = io.BytesIO()
+    save_args = {"quality": quality}
+    if fmt == "JPEG":
+        save_args["optimize"] = True
+    else:
+        save_args["method"] = 4
+    img.save(out, format=fmt, **save_args)
+    return out.getvalue(), Image.MIME[fmt]
+
+
+async def preprocess_image_async(data: Union[bytes, BinaryIO], **kwargs) -> Tuple[bytes, str]:
+    """Run preprocess_image in a worker thread so decoding never blocks the event loop."""
+    return await asyncio.to_thread(preprocess_image, data, **kwargs)
+
+
+# Benchmark: bytes sent and latency per image, optionally including the Gemini call
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import numpy as np
+    from PIL import Image
+
+    arg_parser = argparse.ArgumentParser(description="Benchmark verification image preprocessing")
+    arg_parser.add_argument("images", nargs="*", help="image files (default: a synthetic 12MP photo)")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--task", help="also time the Gemini verification for this task description")
+    args = arg_parser.parse_args()
+
+    samples = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            samples.append((path, f.read()))
+    if not samples:
+        noise = np.random.default_rng(0).integers(0, 255, (3024, 4032, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(noise).save(buf, format="JPEG", quality=92)
+        samples.append(("synthetic-12mp.jpg", buf.getvalue()))
+
+    for name, raw in samples:
+        print(f"\n{name}: {len(raw) / 1024:.0f} KiB, {detect_format(raw)}")
+        for fmt in ("JPEG", "WEBP"):
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                out, mime = preprocess_image(raw, fmt=fmt)
+                timings.append(time.perf_counter() - start)
+            print(f"  {fmt:<5} -> {len(out) / 1024:7.0f} KiB ({len(out) / len(raw):.1%}) "
+                  f"preprocess {min(timings) * 1000:6.1f} ms")
+
+        if args.task:
+            from image_validator import validate_task_image
+
+            for label, payload, mime in (("original", raw, detect_format(raw)),
+                                         ("preprocessed", *preprocess_image(raw))):
+                start = time.perf_counter()
+                validate_task_image(args.task, payload, mime)
+                print(f"  gemini {label:<12} {len(payload) / 1024:7.0f} KiB "
+                      f"{(time.perf_counter() - start) * 1000:7.0f} ms end-to-end")
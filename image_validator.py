@@ -1,36 +1,73 @@
 #!/usr/bin/env python3
 import os
 import base64
-from typing import Any, Dict, List, Optional
+import logging
+from functools import lru_cache
+from typing import Any
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from bson.objectid import ObjectId
-from google.generativeai import GenerativeModel, configure
 from fastapi import HTTPException
-import certifi
-import traceback
+from gemini_client import GeminiError, get_gemini_client
+from observability import fields
 
 # Load environment variables
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_DBNAME = os.getenv("MONGO_DB", "lahacks25")
 
-# Configure Gemini
-configure(api_key=GEMINI_API_KEY)
-gemini = GenerativeModel("gemini-1.5-flash")
+log = logging.getLogger(__name__)
 
-# Set up MongoDB
-client: MongoClient[Any] = MongoClient(MONGO_URL, tls=True, tlsCAFile=certifi.where())
-db: Any = client[MONGO_DBNAME]
+@lru_cache(maxsize=1)
+def get_gemini_model() -> Any:
+    """
+    SDK model for the blocking validate_task_image path, configured on first
+    use. The app goes through gemini_client instead and never loads the SDK.
+    """
+    from google.generativeai import GenerativeModel, configure
+
+    configure(api_key=GEMINI_API_KEY)
+    return GenerativeModel("gemini-1.5-flash")
 
-def validate_task_image(task_description: str, image_data: str) -> bool:
+GENERATION_CONFIG = {
+    "temperature": 0.0,
+    "max_output_tokens": 3,
+    "top_p": 1,
+    "top_k": 1
+}
+
+def build_prompt(task_description: str) -> str:
+    return f"""
+        Task Description: "{task_description}"
+        
+        Please analyze this image and determine if it clearly shows the completion of the task.
+        Consider:
+        1. Does the image show the expected outcome of the task?
+        2. Is the image clear and unambiguous?
+        3. Does it match the task description?
+        
+        Answer only "YES" if the image clearly shows task completion, or "NO" if it doesn't.
+        """
+
+def decode_data_uri(image_data: str) -> bytes:
+    """
+    Decodes a base64 data URI into raw image bytes.
+
+    Raises:
+        HTTPException: If the data URI is malformed
+    """
+    try:
+        header, b64 = image_data.split(",", 1)
+        return base64.b64decode(b64)
+    except Exception as e:
+        log.warning("Error decoding base64 image: %s", e, extra=fields(length=len(image_data)))
+        raise HTTPException(400, f"Invalid image format: {str(e)}")
+
+def validate_task_image(task_description: str, image: bytes, mime_type: str = "image/jpeg") -> bool:
     """
     Validates if an image shows task completion using Gemini API.
     
     Args:
         task_description: The description of the task to verify
-        image_data: Base64 encoded image data (with data URI prefix)
+        image: Encoded image bytes (see image_preprocessing.preprocess_image)
+        mime_type: MIME type of the encoded image
         
     Returns:
         bool: True if the image shows task completion, False otherwise
@@ -38,38 +75,16 @@ def validate_task_image(task_description: str, image_data: str) -> bool:
     Raises:
         HTTPException: If there's an error processing the image
     """
+    context = fields(task=task_description, image_bytes=len(image), mime_type=mime_type)
     try:
-        print(f"\n=== Starting Image Validation ===")
-        print(f"Task Description: {task_description}")
-        
-        # Decode base64 image
-        try:
-            print("Decoding base64 image...")
-            header, b64 = image_data.split(",", 1)
-            data = base64.b64decode(b64)
-            print("Base64 image decoded successfully")
-        except Exception as e:
-            print(f"Error decoding base64 image: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
-            raise HTTPException(400, f"Invalid image format: {str(e)}")
+        log.debug("Starting image validation", extra=context)
         
         # Prepare the prompt
-        prompt = f"""
-        Task Description: "{task_description}"
-        
-        Please analyze this image and determine if it clearly shows the completion of the task.
-        Consider:
-        1. Does the image show the expected outcome of the task?
-        2. Is the image clear and unambiguous?
-        3. Does it match the task description?
-        
-        Answer only "YES" if the image clearly shows task completion, or "NO" if it doesn't.
-        """
+        prompt = build_prompt(task_description)
         
-        print("Sending request to Gemini API...")
         try:
             # Generate content with Gemini
-            response = gemini.generate_content(
+            response = get_gemini_model().generate_content(
                 contents=[
                     {
                         "role": "user",
@@ -77,62 +92,73 @@ def validate_task_image(task_description: str, image_data: str) -> bool:
                             {"text": prompt},
                             {
                                 "inline_data": {
-                                    "mime_type": "image/jpeg",
-                                    "data": b64
+                                    "mime_type": mime_type,
+                                    "data": image
                                 }
                             }
                         ]
                     }
                 ],
-                generation_config={
-                    "temperature": 0.0,
-                    "max_output_tokens": 3,
-                    "top_p": 1,
-                    "top_k": 1
-                }
+                generation_config=GENERATION_CONFIG
             )
-            print("Received response from Gemini API")
             
             # Parse the response
             if not response:
-                print("Empty response from Gemini API")
                 raise HTTPException(500, "No response from Gemini API")
             
             if not hasattr(response, 'text'):
-                print("Response has no text attribute")
-                print(f"Response object: {response}")
+                log.warning("Gemini response has no text: %r", response, extra=context)
                 raise HTTPException(500, "Invalid response format from Gemini API")
             
             answer = response.text.strip().upper()
-            print(f"Gemini API response: {answer}")
-            
             is_valid = answer.startswith("YES")
-            print(f"Validation result: {'valid' if is_valid else 'invalid'}")
-            print("=== Image Validation Complete ===\n")
+            log.debug("Image validation complete", extra=fields(**context["fields"], answer=answer, valid=is_valid))
             
             return is_valid
             
         except Exception as e:
-            print(f"Error in Gemini API call: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
+            log.exception("Error in Gemini API call", extra=context)
             raise HTTPException(500, f"Error processing image with Gemini: {str(e)}")
         
     except HTTPException as he:
-        print(f"HTTP Exception: {he.detail}")
+        log.warning("Image validation failed: %s", he.detail, extra=context)
         raise he
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        log.exception("Unexpected error in image validation", extra=context)
         raise HTTPException(500, f"Error processing image: {str(e)}")
 
 
+async def validate_task_image_async(task_description: str, image: bytes, mime_type: str = "image/jpeg") -> bool:
+    """
+    Async variant of validate_task_image for request handlers.
+
+    Goes through the shared GeminiClient, which bounds concurrency, rate-limits
+    per API key, retries with jitter and coalesces identical in-flight requests.
+
+    Raises:
+        HTTPException: If the Gemini request fails
+    """
+    try:
+        answer = await get_gemini_client().generate(
+            build_prompt(task_description), image, mime_type,
+            {"temperature": 0.0, "maxOutputTokens": 3, "topP": 1, "topK": 1}
+        )
+    except GeminiError as e:
+        log.warning("Gemini API call failed: %s", e)
+        raise HTTPException(500, f"Error processing image with Gemini: {str(e)}")
+    return answer.strip().upper().startswith("YES")
+
+
 # Allow standalone testing:
 if __name__ == "__main__":
     import sys
+    from image_preprocessing import preprocess_image
+
     if len(sys.argv) != 3:
-        print("Usage: python3 image_validator.py <user_id> <image_path>")
+        print("Usage: python3 image_validator.py <task_description> <image_path>")
         sys.exit(1)
 
-    uid, img = sys.argv[1], sys.argv[2]
-    res = validate_task_image(uid, img)
+    task, img = sys.argv[1], sys.argv[2]
+    with open(img, "rb") as f:
+        res = validate_task_image(task, *preprocess_image(f.read()))
     print("✅ COMPLETED" if res else "❌ FAILED")
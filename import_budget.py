@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the API modules.
+
+Imports each module in a fresh interpreter under `python -X importtime`,
+with outbound connections and DNS lookups refused, and fails when
+
+- the best of --runs imports takes longer than the budget,
+- any module in HEAVY_MODULES was loaded, or
+- the import tried to touch the network.
+
+Usage:
+    python3 import_budget.py [--budget-ms 1000] [--runs 3] [main image_validator ...]
+
+Exits with status 1 on any failure, so CI can run it as a test.
+
+    IMPORT_BUDGET_MS   default budget per module in milliseconds (default 1000)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 1000))
+
+# SDKs that only specific request paths need; importing the app must not load them
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "stripe", "tweepy", "twilio", "google.generativeai")
+
+CHILD = """
+import json, socket, sys
+
+def refuse(*args, **kwargs):
+    raise RuntimeError("network access while importing")
+
+socket.socket.connect = refuse
+socket.socket.connect_ex = refuse
+socket.create_connection = refuse
+socket.getaddrinfo = refuse
+
+import {module}
+
+print(json.dumps([m for m in {heavy!r} if m in sys.modules]))
+"""
+
+
+def import_once(module: str) -> Tuple[float, List[str], List[Tuple[float, str]]]:
+    """
+    Import `module` in a new interpreter. Returns (milliseconds, heavy modules
+    loaded, (milliseconds, name) of its direct imports).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"importing {module} failed:\n" + "\n".join(errors[-15:]))
+
+    total = 0.0
+    children: List[Tuple[float, str]] = []
+    pending: List[Tuple[float, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        ms = int(cumulative) / 1000
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # A module's direct imports are logged just before it, one level deeper
+        if depth == 1:
+            pending.append((ms, name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                total, children = ms, pending
+            pending = []
+    return total, json.loads(proc.stdout.strip().splitlines()[-1]), sorted(children, reverse=True)
+
+
+def check(module: str, budget_ms: float, runs: int) -> List[str]:
+    """Returns the failures for one module; prints its timing."""
+    results = [import_once(module) for _ in range(runs)]
+    best, heavy, children = min(results)
+    print(f"{module}: best {best:.0f} ms of {runs} (budget {budget_ms:.0f} ms)")
+    for ms, name in children[:8]:
+        print(f"    {ms:7.1f} ms  {name}")
+
+    failures = []
+    if best > budget_ms:
+        failures.append(f"{module} took {best:.0f} ms to import, budget is {budget_ms:.0f} ms")
+    if heavy:
+        failures.append(f"{module} loads {', '.join(heavy)} at import time")
+    return failures
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Fail when importing the app gets slow or does I/O")
+    arg_parser.add_argument("modules", nargs="*", default=["main", "image_validator"])
+    arg_parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    arg_parser.add_argument("--runs", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    failures: List[str] = []
+    for name in args.modules:
+        try:
+            failures += check(name, args.budget_ms, args.runs)
+        except RuntimeError as e:
+            failures.append(str(e))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
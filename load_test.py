@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Load test for the FastAPI app against a local mongod.
+
+Start a mongod and the app pointed at it, e.g.
+
+    MONGO_URL=mongodb://localhost:27017 MONGO_TLS=false uvicorn main:app --port 8000
+
+then create the indexes once with `python3 migrate_indexes.py` (same environment) and run
+
+    MONGO_URL=mongodb://localhost:27017 MONGO_TLS=false \\
+        python3 load_test.py --url http://localhost:8000 --concurrency 50 --requests 1000
+
+The script seeds one user per concurrent worker, fires concurrent photo
+verifications and prints latency percentiles and throughput.
+
+With --mode memory --server-pid <uvicorn pid> it instead sends large photos
+one at a time through the JSON (/verify-task-photo) and multipart
+(/verify-task-photo-upload) routes and reports the server's peak RSS growth
+per request, read from /proc (Linux only).
+
+With --mode tasks it seeds users with 10, 1k and 10k tasks and reports
+response size and latency of /tasks/{user_id}: the first page, every page,
+pending tasks due this week, and tasks changed in the last minute.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import aiohttp
+from bson import ObjectId
+from PIL import Image
+
+import data_access
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def sample_photo(size: int = 64) -> str:
+    buf = io.BytesIO()
+    Image.new("RGB", (size, size), (200, 30, 30)).save(buf, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+def large_photo() -> bytes:
+    """A ~12 MP photo-sized JPEG with enough detail to stay several MB."""
+    import numpy as np
+
+    noise = np.random.default_rng(0).integers(0, 255, (3024, 4032, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(noise).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def read_status_kb(pid: int, field: str) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def reset_peak_rss(pid: int) -> None:
+    # Writing 5 to clear_refs resets VmHWM to the current RSS
+    with open(f"/proc/{pid}/clear_refs", "w") as f:
+        f.write("5")
+
+
+async def seed(workers: int, tasks_per_user: int) -> List[tuple]:
+    """Insert load-test users with pending tasks. Returns (user_id, task_id) pairs."""
+    db = data_access.get_db()
+    store = data_access.get_task_store()
+    pairs = []
+    due = datetime.utcnow() + timedelta(days=1)
+    for i in range(workers):
+        user_id = (await db.users.insert_one({
+            "email": f"loadtest-{ObjectId()}@example.com",
+            "nickname": f"loadtest{i}",
+            "phone": "+15555550100",
+            "tasks": [],
+        })).inserted_id
+        for _ in range(tasks_per_user):
+            task_id = ObjectId()
+            await store.add(user_id, {
+                "_id": task_id,
+                "description": "Make the bed",
+                "frequency": "daily",
+                "charity_id": ObjectId(),
+                "donation_amount": 100,
+                "due_date": due,
+                "did_task": False,
+            })
+            pairs.append((str(user_id), str(task_id)))
+    return pairs
+
+
+async def verify_photos(url: str, pairs: List[tuple], concurrency: int, total: int) -> List[float]:
+    photo = sample_photo()
+    latencies: List[float] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(pairs[i % len(pairs)])
+
+    async def worker(session: aiohttp.ClientSession):
+        while not queue.empty():
+            user_id, task_id = queue.get_nowait()
+            start = time.perf_counter()
+            async with session.post(f"{url}/verify-task-photo", json={
+                "user_id": user_id, "task_id": task_id, "photo_data": photo
+            }) as resp:
+                await resp.read()
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    return latencies
+
+
+async def measure_memory(url: str, pairs: List[tuple], server_pid: int, runs: int) -> None:
+    raw = large_photo()
+    data_uri = "data:image/jpeg;base64," + base64.b64encode(raw).decode()
+    print(f"photo: {len(raw) / 1024 / 1024:.1f} MiB raw, {len(data_uri) / 1024 / 1024:.1f} MiB as data URI")
+
+    async with aiohttp.ClientSession() as session:
+        for route in ("json", "multipart"):
+            growth = []
+            for i in range(runs):
+                user_id, task_id = pairs[i % len(pairs)]
+                reset_peak_rss(server_pid)
+                baseline = read_status_kb(server_pid, "VmRSS")
+                if route == "json":
+                    request = session.post(f"{url}/verify-task-photo", json={
+                        "user_id": user_id, "task_id": task_id, "photo_data": data_uri
+                    })
+                else:
+                    form = aiohttp.FormData()
+                    form.add_field("user_id", user_id)
+                    form.add_field("task_id", task_id)
+                    form.add_field("photo", raw, filename="photo.jpg", content_type="image/jpeg")
+                    request = session.post(f"{url}/verify-task-photo-upload", data=form)
+                async with request as resp:
+                    await resp.read()
+                growth.append(read_status_kb(server_pid, "VmHWM") - baseline)
+            print(f"{route:<10} peak RSS growth per request: "
+                  f"mean {sum(growth) / len(growth) / 1024:.1f} MiB, max {max(growth) / 1024:.1f} MiB")
+
+
+async def seed_task_list(count: int, changed: int) -> str:
+    """One user with `count` tasks spread over a year, `changed` of them touched just now."""
+    db = data_access.get_db()
+    store = data_access.get_task_store()
+    now = datetime.utcnow()
+    long_ago = now - timedelta(days=30)
+    tasks = [{
+        "_id": ObjectId(),
+        "description": f"Task {i}",
+        "frequency": "daily",
+        "charity_id": ObjectId(),
+        "donation_amount": 100,
+        "due_date": now + timedelta(days=i * 365 / count - 180),
+        "did_task": i % 3 == 0,
+        "updated_at": now if i < changed else long_ago,
+    } for i in range(count)]
+    user_id = (await db.users.insert_one({
+        "email": f"loadtest-{ObjectId()}@example.com",
+        "nickname": "loadtest",
+        "password": b"$2b$12$" + b"x" * 53,
+        "tasks": [],
+    })).inserted_id
+    # Bulk insert: pushing 10k tasks one by one would rewrite the user document each time
+    if store.mode == "collection":
+        await db.tasks.insert_many([{**t, "user_id": user_id} for t in tasks])
+    else:
+        await db.users.update_one({"_id": user_id}, {"$push": {"tasks": {"$each": tasks}}})
+    return str(user_id)
+
+
+async def measure_tasks(url: str, runs: int) -> None:
+    now = datetime.utcnow()
+    queries = {
+        "first page": {},
+        "all pages": {},
+        "pending, due this week": {"status": "pending", "due_from": now.isoformat(),
+                                   "due_to": (now + timedelta(days=7)).isoformat()},
+        "changed last minute": {"changed_since": (now - timedelta(minutes=1)).isoformat()},
+    }
+    print(f"{'tasks':>6} {'query':<24} {'pages':>5} {'bytes':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    async with aiohttp.ClientSession() as session:
+        for count in (10, 1000, 10000):
+            user_id = await seed_task_list(count, changed=5)
+            for name, params in queries.items():
+                latencies, size, pages = [], 0, 0
+                for _ in range(runs):
+                    size, pages, cursor = 0, 0, None
+                    start = time.perf_counter()
+                    while True:
+                        query = {**params, **({"cursor": cursor} if cursor else {})}
+                        async with session.get(f"{url}/tasks/{user_id}", params=query) as resp:
+                            body = await resp.read()
+                            cursor = resp.headers.get("X-Next-Cursor")
+                        size += len(body)
+                        pages += 1
+                        if not cursor or name != "all pages":
+                            break
+                    latencies.append(time.perf_counter() - start)
+                print(f"{count:>6} {name:<24} {pages:>5} {size:>10} "
+                      f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.mode == "tasks":
+        await measure_tasks(args.url, args.runs)
+        await data_access.close()
+        return
+    pairs = await seed(args.concurrency, args.tasks_per_user)
+    if args.mode == "memory":
+        await measure_memory(args.url, pairs, args.server_pid, args.runs)
+        await data_access.close()
+        return
+
+    start = time.perf_counter()
+    latencies = await verify_photos(args.url, pairs, args.concurrency, args.requests)
+    elapsed = time.perf_counter() - start
+    await data_access.close()
+
+    print(f"requests={len(latencies)} concurrency={args.concurrency} elapsed={elapsed:.2f}s "
+          f"throughput={len(latencies) / elapsed:.1f} req/s")
+    for pct in (50, 95, 99):
+        print(f"p{pct}: {percentile(latencies, pct) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Concurrent photo verification load test")
+    arg_parser.add_argument("--url", default="http://localhost:8000")
+    arg_parser.add_argument("--concurrency", type=int, default=50)
+    arg_parser.add_argument("--requests", type=int, default=1000)
+    arg_parser.add_argument("--tasks-per-user", type=int, default=20)
+    arg_parser.add_argument("--mode", choices=("latency", "memory", "tasks"), default="latency")
+    arg_parser.add_argument("--server-pid", type=int, help="uvicorn pid, required for --mode memory")
+    arg_parser.add_argument("--runs", type=int, default=10, help="requests per route or query in --mode memory/tasks")
+    asyncio.run(main(arg_parser.parse_args()))
@@ -1,69 +1,169 @@
 import os
-import io
-import base64
-import tempfile
-from typing import Any, Dict, List, Optional
-
-from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from fastapi import APIRouter, FastAPI, Request, BackgroundTasks, HTTPException, File, Form, Query, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel, Field
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-import certifi
-from pymongo import MongoClient, ASCENDING
 from bson import ObjectId
-import bcrypt
-import stripe
-import tweepy  # type: ignore[import]
-from PIL import Image
-import numpy as np
-import cv2
-from google.generativeai import GenerativeModel, configure
-import traceback
-from image_validator import validate_task_image
+import orjson
+from image_validator import decode_data_uri, validate_task_image_async
+from gemini_client import close_gemini_client
+from image_preprocessing import preprocess_image_async
+import data_access
+from charity_cache import CharityCache, etag_matches
+from donations import run_donation_pass
+from observability import CONTENT_TYPE, MetricsMiddleware, add_stats, fields, render_metrics, start_logging, track
+from password_hashing import PasswordHasher
+from task_store import DONE as TASK_DONE, PENDING as TASK_PENDING, decode_cursor, encode_cursor
+from verification_cache import VERIFICATION_CACHE_PERSIST, VerificationCache, dhash
+
+# Importing this module must stay cheap and free of I/O: clients are created
+# by the lifespan, heavy SDKs (stripe, tweepy, Pillow, OpenCV) are imported by
+# the code paths that use them, and indexes are built by migrate_indexes.py.
+# import_budget.py checks this.
 
 # Load environment
 load_dotenv()
-stripe.api_key       = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_SECRET_KEY    = os.getenv("STRIPE_SECRET_KEY")
 TWITTER_API_KEY      = os.getenv("TWITTER_API_KEY")
 TWITTER_API_SECRET   = os.getenv("TWITTER_API_SECRET")
 TWITTER_CALLBACK_URL = os.getenv("TWITTER_CALLBACK_URL")
 SESSION_SECRET       = os.getenv("SESSION_SECRET")
-GEMINI_API_KEY       = os.getenv("GEMINI_API_KEY")
-
-# Configure Gemini
-configure(api_key=GEMINI_API_KEY)
-gemini = GenerativeModel("gemini-1.5-flash")
-
-# MongoDB
-MONGO_URL    = os.getenv("MONGO_URL")
-MONGO_DBNAME = os.getenv("MONGO_DB", "lahacks25")
-client: MongoClient[Any] = MongoClient(MONGO_URL, tls=True, tlsCAFile=certifi.where())
-db: Any = client[MONGO_DBNAME]
-
-# Ensure indexes
-db.users.create_index([("email", ASCENDING)], unique=True)
-db.users.create_index([("tasks.due_date", ASCENDING)])
-
-# FastAPI setup
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware, allow_origins=["*"], allow_credentials=True,
-    allow_methods=["*"], allow_headers=["*"],
-)
-app.add_middleware(
-    SessionMiddleware, secret_key=SESSION_SECRET,
-    session_cookie="session", max_age=14*24*3600, same_site="lax"
-)
+MAX_UPLOAD_BYTES     = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+MAX_BATCH_PHOTOS     = int(os.getenv("MAX_BATCH_PHOTOS", 20))
+TASKS_PAGE_SIZE      = int(os.getenv("TASKS_PAGE_SIZE", 100))
+TASKS_PAGE_MAX       = int(os.getenv("TASKS_PAGE_MAX", 1000))
+
+# Room for the other form fields, multipart boundaries and the JSON envelope
+BODY_OVERHEAD_BYTES = 64 * 1024
+# A base64 data URI is 4/3 the size of the photo
+MAX_PHOTO_DATA_BYTES = MAX_UPLOAD_BYTES * 4 // 3
+BODY_LIMITS = {
+    "/verify-task-photo-upload": MAX_UPLOAD_BYTES + BODY_OVERHEAD_BYTES,
+    "/verify-task-photo": MAX_PHOTO_DATA_BYTES + BODY_OVERHEAD_BYTES,
+    "/verify-task-photos": MAX_BATCH_PHOTOS * MAX_PHOTO_DATA_BYTES + BODY_OVERHEAD_BYTES,
+}
+
+log = logging.getLogger(__name__)
+
+# Shared services, created once per process by start_services
+db: Any = None
+tasks_store: Any = None
+passwords: Any = None
+charity_cache: Any = None
+verification_cache: Any = None
+
+def start_services() -> None:
+    """Create the MongoDB-backed services. The Mongo client is shared through data_access."""
+    global db, tasks_store, passwords, charity_cache, verification_cache
+    if db is not None:
+        return
+    db = data_access.get_db()
+    tasks_store = data_access.get_task_store()
+    passwords = PasswordHasher()
+    charity_cache = CharityCache(db)
+    verification_cache = VerificationCache(
+        collection=db.verification_cache if VERIFICATION_CACHE_PERSIST else None
+    )
+
+async def stop_services() -> None:
+    global db, tasks_store, passwords, charity_cache, verification_cache
+    await close_gemini_client()
+    if passwords is not None:
+        passwords.close()
+    await data_access.close()
+    db = tasks_store = passwords = charity_cache = verification_cache = None
+
+# Component stats, read at scrape time; empty until the services start
+add_stats("charity_cache", lambda: charity_cache.stats() if charity_cache else {})
+add_stats("password_hashing", lambda: passwords.stats() if passwords else {})
+add_stats("verification_cache", lambda: {"hits": verification_cache.hits, "misses": verification_cache.misses}
+          if verification_cache else {})
+
+@lru_cache(maxsize=1)
+def get_stripe() -> Any:
+    """The stripe SDK, imported and configured on first use."""
+    import stripe
+
+    stripe.api_key = STRIPE_SECRET_KEY
+    return stripe
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_logging()
+    start_services()
+    yield
+    await stop_services()
+
+router = APIRouter()
+
+class BodyLimitMiddleware:
+    """
+    Rejects request bodies over the limit for their path with 413: up front
+    when Content-Length is too large, otherwise as soon as the streamed body
+    passes the limit, so an oversized photo is never spooled or buffered whole.
+    """
+
+    def __init__(self, app: Any, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        detail = f"Request body larger than {limit} bytes"
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Dict[str, Any]:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes the response
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def create_app() -> FastAPI:
+    """Build the app; also usable as `uvicorn --factory main:create_app`."""
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware, allow_origins=["*"], allow_credentials=True,
+        allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor"],
+    )
+    app.add_middleware(
+        SessionMiddleware, secret_key=SESSION_SECRET,
+        session_cookie="session", max_age=14*24*3600, same_site="lax"
+    )
+    app.add_middleware(BodyLimitMiddleware, limits=BODY_LIMITS)
+    app.add_middleware(MetricsMiddleware, service="api")
+    app.include_router(router)
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+    return app
 
 # Serve UI
-@app.get("/", include_in_schema=False)
+@router.get("/", include_in_schema=False)
 def serve_ui():
     return FileResponse("static/index.html")
-app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Models
 class PhotoVerification(BaseModel):
@@ -71,6 +171,14 @@ class PhotoVerification(BaseModel):
     task_id: str
     photo_data: str  # Data URI (base64)
 
+class TaskPhoto(BaseModel):
+    task_id: str
+    photo_data: str  # Data URI (base64)
+
+class BatchPhotoVerification(BaseModel):
+    user_id: str
+    photos: List[TaskPhoto]
+
 class RegisterUser(BaseModel):
     email: str
     password: str
@@ -105,18 +213,20 @@ class PartyUpdate(BaseModel):
     party: str
 
 # --- Auth Endpoints ---
-@app.post("/register")
-def register(user: RegisterUser):
+@router.post("/register")
+async def register(user: RegisterUser):
     # check for existing email
-    if db.users.find_one({"email": user.email}):
+    if await db.users.find_one({"email": user.email}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="The user already exists")
+    # hash password first: a full hashing pool rejects with 503 before any Stripe customer exists
+    hashed_pw = await passwords.hash(user.password)
     # create stripe customer
     try:
-        customer = stripe.Customer.create(email=user.email)
+        # The first call also imports the SDK, so keep it off the event loop
+        with track("stripe", "customer.create"):
+            customer = await run_in_threadpool(lambda: get_stripe().Customer.create(email=user.email))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Stripe error: {e}")
-    # hash password
-    hashed_pw = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
     # insert user with empty tasks list
     doc = {
         "email": user.email,
@@ -124,47 +234,59 @@ def register(user: RegisterUser):
         "nickname": user.nickname,
         "stripe_customer_id": customer.id,
         "phone": user.phone,
-        "tasks": []
+        "tasks": [],
+        "updated_at": datetime.now(timezone.utc)
     }
-    res = db.users.insert_one(doc)
+    res = await db.users.insert_one(doc)
     return {"message": "User created", "user_id": str(res.inserted_id), "stripe_customer_id": customer.id}
 
-@app.post("/login")
-def login(credentials: LoginUser):
-    user = db.users.find_one({"email": credentials.email})
-    if not user or not bcrypt.checkpw(credentials.password.encode('utf-8'), user['password']):
+@router.post("/login")
+async def login(credentials: LoginUser, background_tasks: BackgroundTasks):
+    user = await db.users.find_one({"email": credentials.email}, {"password": 1, "nickname": 1, "email": 1})
+    if not user or not await passwords.verify(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Wrong username or password")
+    # Upgrade hashes made with an older BCRYPT_ROUNDS after responding
+    if passwords.needs_rehash(user['password']):
+        background_tasks.add_task(passwords.rehash, db, user['_id'], credentials.password, user['password'])
     return {"user_id": str(user['_id']), "nickname": user.get('nickname'), "email": user['email']}
 
 # --- Charity Endpoints ---
-@app.get("/charities")
-def get_charities():
+@router.get("/charities")
+async def get_charities(request: Request):
     try:
-        charities = list(db.charities.find({}, {"_id": 1, "name": 1}))
-        # Convert ObjectId to string for JSON serialization
-        for charity in charities:
-            charity["_id"] = str(charity["_id"])
-        return charities
+        snapshot = await charity_cache.snapshot()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching charities: {str(e)}")
-
-@app.post("/charity")
-def add_charity(charity: CharityAdd):
-    res = db.charities.insert_one({
+    # Clients revalidate with If-None-Match and get an empty 304 while the list is unchanged
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        charity_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint: route latencies, dependency timings and component stats."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+@router.post("/charity")
+async def add_charity(charity: CharityAdd):
+    res = await db.charities.insert_one({
         "name": charity.name,
         "stripe_account_id": charity.stripe_account_id
     })
+    await charity_cache.invalidate()
     return {"message": "Charity added", "charity_id": str(res.inserted_id)}
 
 # --- Task Endpoints ---
-@app.post("/task")
-def add_task(t: TaskAdd):
+@router.post("/task")
+async def add_task(t: TaskAdd):
     try:
         # validate user
         if not ObjectId.is_valid(t.user_id):
             raise HTTPException(status_code=400, detail="Invalid user_id format")
         
-        user_obj = db.users.find_one({"_id": ObjectId(t.user_id)})
+        user_obj = await db.users.find_one({"_id": ObjectId(t.user_id)}, {"_id": 1})
         if not user_obj:
             raise HTTPException(status_code=404, detail=f"User {t.user_id} not found")
         
@@ -172,7 +294,7 @@ def add_task(t: TaskAdd):
         if not ObjectId.is_valid(t.charity_id):
             raise HTTPException(status_code=400, detail="Invalid charity_id format")
             
-        charity_obj = db.charities.find_one({"_id": ObjectId(t.charity_id)})
+        charity_obj = await charity_cache.get(ObjectId(t.charity_id))
         if not charity_obj:
             raise HTTPException(status_code=404, detail=f"Charity {t.charity_id} not found")
         
@@ -188,12 +310,7 @@ def add_task(t: TaskAdd):
             "did_task": False
         }
         
-        result = db.users.update_one(
-            {"_id": ObjectId(t.user_id)}, 
-            {"$push": {"tasks": task_doc}}
-        )
-        
-        if result.modified_count == 0:
+        if not await tasks_store.add(ObjectId(t.user_id), task_doc):
             raise HTTPException(status_code=500, detail="Failed to add task to user")
             
         return {"message": "Task added", "task_id": str(task_id)}
@@ -203,23 +320,21 @@ def add_task(t: TaskAdd):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
-@app.post("/report-task")
-def report_task(report: TaskReport):
+@router.post("/report-task")
+async def report_task(report: TaskReport):
     # validate identifiers
     if not ObjectId.is_valid(report.user_id) or not ObjectId.is_valid(report.task_id):
         raise HTTPException(status_code=400, detail="Invalid ID(s)")
-    # update did_task flag inside tasks array
-    upd = db.users.update_one(
-        {"_id": ObjectId(report.user_id)},
-        {"$set": {"tasks.$[elem].did_task": report.did_task}},
-        array_filters=[{"elem._id": ObjectId(report.task_id)}]
-    )
-    if upd.matched_count == 0:
+    # update did_task flag on the task
+    matched, _ = await tasks_store.set_did_task(ObjectId(report.user_id), ObjectId(report.task_id), report.did_task)
+    if matched == 0:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"message": f"Recorded did_task={report.did_task} for task {report.task_id}"}
 
-@app.get("/login/twitter")
+@router.get("/login/twitter")
 async def twitter_login(request: Request):
+    import tweepy  # type: ignore[import]
+
     auth = tweepy.OAuth1UserHandler(
         TWITTER_API_KEY,
         TWITTER_API_SECRET,
@@ -232,8 +347,10 @@ async def twitter_login(request: Request):
     request.session["request_token_secret"] = auth.request_token["oauth_token_secret"]
     return RedirectResponse(redirect_url)
 
-@app.get("/callback/twitter")
+@router.get("/callback/twitter")
 async def twitter_callback(request: Request):
+    import tweepy  # type: ignore[import]
+
     oauth_token    = request.query_params.get("oauth_token")
     oauth_verifier = request.query_params.get("oauth_verifier")
     if not oauth_token or not oauth_verifier:
@@ -268,15 +385,15 @@ async def twitter_callback(request: Request):
     }
 
     # Upsert into your users collection
-    result = db.users.update_one(
+    result = await db.users.update_one(
         {"twitter.id": twitter_id},
         {"$set": {
             "twitter": twitter_obj
-        }},
+        }, "$currentDate": {"updated_at": True}},
         upsert=True
     )
 
-    existing = db.users.find_one({"twitter.id": twitter_id})
+    existing = await db.users.find_one({"twitter.id": twitter_id}, {"_id": 1})
     if existing is None:
         raise HTTPException(500, "Failed to look up existing Twitter user")
 
@@ -362,173 +479,214 @@ async def twitter_callback(request: Request):
     return HTMLResponse(content=html_content)
 
 # Donation check replaces routines logic
+last_donation_run: Optional[Dict[str, Any]] = None
+
 async def check_and_donate():
-    now = datetime.utcnow()
-    for user in db.users.find():
-        for task in user.get('tasks', []):
-            # skip if already done or no donation needed
-            if task.get('did_task'):
-                continue
-            
-            # TODO: implement frequency logic based on task['frequency'] and task['due_date']
-
-            c = db.charities.find_one({"_id": task['charity_id']})
-            if not c:
-                continue
-            try:
-                print(f"Donating ${task['donation_amount']/100:.2f} from {user['email']} to {c['name']} for '{task['description']}'")
-            except Exception as e:
-                print(f"Error donating for task {task['_id']}: {e}")
-            # reset did_task
-            db.users.update_one(
-                {"_id": user['_id']},
-                {"$set": {"tasks.$[elem].did_task": False}},
-                array_filters=[{"elem._id": task['_id']}]   
-            )
-
-@app.post("/run-donations")
+    global last_donation_run
+    charities = (await charity_cache.snapshot()).by_id
+    stats = await run_donation_pass(db, tasks_store, charities=charities)
+    stats["finished_at"] = datetime.utcnow().isoformat()
+    last_donation_run = stats
+    log.info("Donation run: %d donations over %d tasks in %.0f ms", stats['donations'], stats['tasks'],
+             stats['total_ms'], extra=fields(**stats))
+
+@router.post("/run-donations")
 def run_donations(background_tasks: BackgroundTasks):
     background_tasks.add_task(check_and_donate)
-    return {"message": "Donation check started in background"}
-
-@app.get("/tasks/{user_id}")
-def get_user_tasks(user_id: str):
+    return {"message": "Donation check started in background", "last_run": last_donation_run}
+
+@router.get("/tasks/{user_id}")
+async def get_user_tasks(
+    user_id: str,
+    status: Optional[str] = None,
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+    changed_since: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(TASKS_PAGE_SIZE, ge=1, le=TASKS_PAGE_MAX),
+):
+    """
+    One page of a user's tasks, soonest due first. When more tasks match,
+    the X-Next-Cursor header carries the `cursor` for the next page.
+    `changed_since` returns only tasks created or updated after that time.
+    """
     try:
         # validate user
         if not ObjectId.is_valid(user_id):
             raise HTTPException(status_code=400, detail="Invalid user_id format")
-        
-        user_obj = db.users.find_one({"_id": ObjectId(user_id)})
-        if not user_obj:
-            raise HTTPException(status_code=404, detail=f"User {user_id} not found")
-        
+        if status not in (None, TASK_PENDING, TASK_DONE):
+            raise HTTPException(status_code=400, detail=f"status must be '{TASK_PENDING}' or '{TASK_DONE}'")
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
         # get tasks
-        tasks = user_obj.get('tasks', [])
-        
-        # convert ObjectIds to strings
-        for task in tasks:
-            task['_id'] = str(task['_id'])
-            task['charity_id'] = str(task['charity_id'])
-        
-        return tasks
+        page = await tasks_store.page_for_user(
+            ObjectId(user_id), status=status, due_from=due_from, due_to=due_to,
+            changed_since=changed_since, after=after, limit=limit
+        )
+        if page is None:
+            raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+
+        tasks, next_after = page
+        headers = {"X-Next-Cursor": encode_cursor(next_after)} if next_after else None
+        return Response(content=orjson.dumps(tasks), media_type="application/json", headers=headers)
         
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
-@app.post("/verify-task-photo")
-async def verify_task_photo(v: PhotoVerification):
+async def check_photo(task: Dict[str, Any], photo: Union[str, BinaryIO], user_id: str, task_id: str):
+    """
+    Decide whether `photo` shows `task` done. Returns (is_valid, reused_photo).
+    `photo` is a data URI or an open binary file.
+    """
+    # Shrink and normalize the photo off the event loop
+    if isinstance(photo, str):
+        photo = await asyncio.to_thread(decode_data_uri, photo)
+    image, mime_type = await preprocess_image_async(photo)
+
+    # Reuse the verdict for the same or a near-duplicate photo
+    description = task.get('description', 'the assigned task')
+    photo_hash = await asyncio.to_thread(dhash, image)
+    cached = await verification_cache.lookup(description, photo_hash, user_id, task_id)
+    if cached.reused_by:
+        log.info("Photo previously submitted for other tasks",
+                 extra=fields(user_id=user_id, task_id=task_id, reused_by=cached.reused_by))
+
+    if cached.verdict is not None:
+        log.debug("Using cached verification result", extra=fields(user_id=user_id, task_id=task_id))
+        return cached.verdict, bool(cached.reused_by)
+
+    # Validate the image using Gemini
+    is_valid = await validate_task_image_async(description, image, mime_type)
+    await verification_cache.store(description, photo_hash, is_valid, user_id, task_id)
+    return is_valid, bool(cached.reused_by)
+
+async def verify_photo(user_id: str, task_id: str, photo: Union[str, BinaryIO]):
+    """Shared by the JSON and multipart routes. `photo` is a data URI or an open binary file."""
+    context = fields(user_id=user_id, task_id=task_id)
     try:
-        print("\n=== Starting Task Photo Verification ===")
-        print(f"Received request - user_id: {v.user_id}, task_id: {v.task_id}")
-        
         # Validate user and task
-        if not ObjectId.is_valid(v.user_id) or not ObjectId.is_valid(v.task_id):
-            print(f"Invalid IDs - user_id: {v.user_id}, task_id: {v.task_id}")
+        if not ObjectId.is_valid(user_id) or not ObjectId.is_valid(task_id):
             raise HTTPException(status_code=400, detail="Invalid user_id or task_id")
-        
-        user = db.users.find_one({"_id": ObjectId(v.user_id)})
-        if not user:
-            print(f"User not found: {v.user_id}")
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Find the task in the user's tasks array
-        task = None
-        for t in user.get('tasks', []):
-            if str(t['_id']) == v.task_id:
-                task = t
-                break
-        
+
+        # Fetch only the task being verified
+        task = await tasks_store.get(ObjectId(user_id), ObjectId(task_id))
         if not task:
-            print(f"Task not found: {v.task_id}")
             raise HTTPException(status_code=404, detail="Task not found")
 
-        print(f"Found task: {task.get('description')}")
-        print("Validating image with Gemini...")
-
         try:
-            # Validate the image using Gemini
-            is_valid = validate_task_image(task.get('description', 'the assigned task'), v.photo_data)
-            print(f"Image validation result: {'valid' if is_valid else 'invalid'}")
-
-            if is_valid:
-                try:
-                    print("Updating task status in database...")
-                    print(f"Updating task {v.task_id} for user {v.user_id}")
-                    
-                    # First verify the task exists
-                    task_exists = db.users.find_one({
-                        "_id": ObjectId(v.user_id),
-                        "tasks._id": ObjectId(v.task_id)
-                    })
-                    
-                    if not task_exists:
-                        print(f"Task {v.task_id} not found in user's tasks")
-                        raise HTTPException(404, "Task not found in user's tasks")
-                    
-                    # Update the task status
-                    result = db.users.update_one(
-                        {"_id": ObjectId(v.user_id)},
-                        {"$set": {"tasks.$[elem].did_task": True}},
-                        array_filters=[{"elem._id": ObjectId(v.task_id)}]
-                    )
-                    
-                    if result.matched_count == 0:
-                        print(f"No matching document found for user {v.user_id}")
-                        raise HTTPException(404, "User document not found")
-                        
-                    if result.modified_count == 0:
-                        print(f"Task {v.task_id} was not modified")
-                        raise HTTPException(500, "Failed to update task status")
-                    
-                    print(f"Successfully updated task {v.task_id} for user {v.user_id}")
-                    return {"success": True, "message": "Task verified and completed"}
-                    
-                except HTTPException as he:
-                    print(f"HTTP Exception during task update: {he.detail}")
-                    raise he
-                except Exception as e:
-                    print(f"Error updating task status: {str(e)}")
-                    print(f"Traceback: {traceback.format_exc()}")
-                    raise HTTPException(500, f"Database error: {str(e)}")
-            else:
-                print("Image verification failed")
-                return {"success": False, "message": "Photo verification failed - image does not clearly show task completion"}
-
-        except HTTPException as he:
-            print(f"HTTP Exception in image validation: {he.detail}")
-            print(f"Traceback: {traceback.format_exc()}")
-            raise he
+            is_valid, reused_photo = await check_photo(task, photo, user_id, task_id)
+        except HTTPException:
+            raise
         except Exception as e:
-            print(f"Unexpected error in image validation: {str(e)}")
-            print(f"Error type: {type(e)}")
-            print(f"Error details: {e.__dict__ if hasattr(e, '__dict__') else 'No details available'}")
-            print(f"Traceback: {traceback.format_exc()}")
+            log.exception("Image validation failed", extra=context)
             raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+        if not is_valid:
+            log.info("Photo rejected", extra=context)
+            return {"success": False, "message": "Photo verification failed - image does not clearly show task completion", "reused_photo": reused_photo}
+
+        try:
+            matched, modified = await tasks_store.set_did_task(ObjectId(user_id), ObjectId(task_id), True)
+        except Exception as e:
+            log.exception("Task status update failed", extra=context)
+            raise HTTPException(500, f"Database error: {str(e)}")
+        if matched == 0:
+            raise HTTPException(404, "Task not found in user's tasks")
+        if modified == 0:
+            raise HTTPException(500, "Failed to update task status")
+
+        log.info("Task verified", extra=context)
+        return {"success": True, "message": "Task verified and completed", "reused_photo": reused_photo}
+
     except HTTPException as he:
-        print(f"HTTP Exception in verify-task-photo: {he.detail}")
-        print(f"Traceback: {traceback.format_exc()}")
-        raise he
+        log.warning("Photo verification failed: %s", he.detail,
+                    extra=fields(user_id=user_id, task_id=task_id, status=he.status_code))
+        raise
     except Exception as e:
-        print(f"Unexpected error in verify-task-photo: {str(e)}")
-        print(f"Error type: {type(e)}")
-        print(f"Error details: {e.__dict__ if hasattr(e, '__dict__') else 'No details available'}")
-        print(f"Traceback: {traceback.format_exc()}")
+        log.exception("Unexpected error in photo verification", extra=context)
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+
+@router.post("/verify-task-photo")
+async def verify_task_photo(v: PhotoVerification):
+    return await verify_photo(v.user_id, v.task_id, v.photo_data)
+
+@router.post("/verify-task-photo-upload")
+async def verify_task_photo_upload(
+    user_id: str = Form(...),
+    task_id: str = Form(...),
+    photo: UploadFile = File(...),
+):
+    """
+    Multipart variant of /verify-task-photo. Starlette spools the photo to a
+    temporary file past 1 MB, and the file is handed to preprocessing as-is
+    instead of being base64 encoded, parsed and decoded again. Bodies over
+    the limit are cut off by BodyLimitMiddleware while they stream in.
+    """
+    try:
+        if photo.size is not None and photo.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Photo larger than {MAX_UPLOAD_BYTES} bytes")
+        return await verify_photo(user_id, task_id, photo.file)
     finally:
-        print("=== Task Photo Verification Complete ===\n")
+        await photo.close()
 
-@app.post("/update-party")
-def update_party(update: PartyUpdate):
+@router.post("/verify-task-photos")
+async def verify_task_photos(batch: BatchPhotoVerification):
+    """
+    Verify one photo per task for a single user. Tasks are loaded with one
+    query, photos are checked concurrently (the Gemini client bounds how many
+    run at once) and every completed task is written in one bulk write.
+    """
+    if not ObjectId.is_valid(batch.user_id) or not all(ObjectId.is_valid(p.task_id) for p in batch.photos):
+        raise HTTPException(status_code=400, detail="Invalid user_id or task_id")
+    if not batch.photos:
+        return {"results": []}
+    if len(batch.photos) > MAX_BATCH_PHOTOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PHOTOS} photos per batch")
+
+    user_oid = ObjectId(batch.user_id)
+    tasks = await tasks_store.get_many(user_oid, [ObjectId(p.task_id) for p in batch.photos])
+    if tasks is None:
+        raise HTTPException(status_code=404, detail="No matching tasks found for user")
+
+    async def check(item: TaskPhoto) -> Dict[str, Any]:
+        task = tasks.get(ObjectId(item.task_id))
+        if not task:
+            return {"task_id": item.task_id, "success": False, "message": "Task not found"}
+        try:
+            is_valid, reused_photo = await check_photo(task, item.photo_data, batch.user_id, item.task_id)
+        except HTTPException as he:
+            return {"task_id": item.task_id, "success": False, "message": he.detail}
+        except Exception as e:
+            log.exception("Error verifying task", extra=fields(user_id=batch.user_id, task_id=item.task_id))
+            return {"task_id": item.task_id, "success": False, "message": f"Error processing image: {str(e)}"}
+        message = ("Task verified and completed" if is_valid
+                   else "Photo verification failed - image does not clearly show task completion")
+        return {"task_id": item.task_id, "success": is_valid, "message": message, "reused_photo": reused_photo}
+
+    results = await asyncio.gather(*(check(item) for item in batch.photos))
+
+    completed = [(user_oid, ObjectId(r["task_id"])) for r in results if r["success"]]
+    try:
+        await tasks_store.bulk_set_did_task(completed, True)
+    except Exception as e:
+        log.exception("Batch task status update failed", extra=fields(user_id=batch.user_id))
+        raise HTTPException(500, f"Database error: {str(e)}")
+    return {"results": results}
+
+@router.post("/update-party")
+async def update_party(update: PartyUpdate):
     try:
         # Validate user ID
         if not ObjectId.is_valid(update.user_id):
             raise HTTPException(status_code=400, detail="Invalid user_id format")
         
         # Update user's party in database
-        result = db.users.update_one(
+        result = await db.users.update_one(
             {"_id": ObjectId(update.user_id)},
             {"$set": {"political_party": update.party}}
         )
@@ -543,15 +701,15 @@ def update_party(update: PartyUpdate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
-@app.get("/user-party/{user_id}")
-def get_user_party(user_id: str):
+@router.get("/user-party/{user_id}")
+async def get_user_party(user_id: str):
     try:
         # Validate user ID
         if not ObjectId.is_valid(user_id):
             raise HTTPException(status_code=400, detail="Invalid user_id format")
         
         # Get user's party from database
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"political_party": 1})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
             
@@ -562,6 +720,9 @@ def get_user_party(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
+# Built after every route is registered on the router
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
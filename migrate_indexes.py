@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Create the MongoDB indexes the API relies on.
+
+Usage:
+    python3 migrate_indexes.py
+
+The app no longer builds indexes when it starts, so run this once per
+deployment, and again after changing TASK_STORAGE or enabling
+VERIFICATION_CACHE_PERSIST. create_index is a no-op for indexes that
+already exist, so re-running it is safe.
+"""
+import asyncio
+from typing import Any, List
+
+from pymongo import ASCENDING
+
+import data_access
+from task_store import COLLECTION, TaskStore
+from verification_cache import VERIFICATION_CACHE_PERSIST, VerificationCache
+
+
+async def ensure_indexes(db: Any, store: TaskStore, persist_verifications: bool = VERIFICATION_CACHE_PERSIST) -> List[str]:
+    """Create every index main.py needs. Returns the collections touched."""
+    await db.users.create_index([("email", ASCENDING)], unique=True)
+    await store.ensure_indexes()
+    touched = ["users", "tasks" if store.mode == COLLECTION else "users.tasks"]
+    if persist_verifications:
+        await VerificationCache(collection=db.verification_cache).ensure_indexes()
+        touched.append("verification_cache")
+    return touched
+
+
+if __name__ == "__main__":
+    async def run() -> List[str]:
+        try:
+            return await ensure_indexes(data_access.get_db(), data_access.get_task_store())
+        finally:
+            await data_access.close()
+
+    print(f"Indexes ensured on {', '.join(asyncio.run(run()))}")
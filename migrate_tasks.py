@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+One-shot migration from embedded `users.tasks` arrays to the `tasks` collection.
+
+Usage:
+    python3 migrate_tasks.py [--unset] [--batch-size N]
+
+Tasks keep their `_id`, so re-running the migration is safe: existing tasks
+are overwritten with the embedded copy. Pass --unset once the app runs with
+TASK_STORAGE=collection to drop the embedded arrays: each user's copied
+tasks are pulled by `_id` once they are written, so tasks pushed while the
+migration runs stay in place for the next run.
+"""
+import argparse
+import asyncio
+from typing import Any
+
+from pymongo import ReplaceOne, UpdateOne
+
+import data_access
+from task_store import COLLECTION, TaskStore
+
+
+async def migrate(db: Any, batch_size: int = 1000, unset: bool = False) -> int:
+    await TaskStore(db, COLLECTION).ensure_indexes()
+
+    migrated = 0
+    ops = []
+    # $pull for users whose tasks are all in `ops` or already written
+    pulls = []
+
+    async def flush() -> None:
+        nonlocal migrated, ops, pulls
+        if ops:
+            await db.tasks.bulk_write(ops, ordered=False)
+            migrated += len(ops)
+            ops = []
+        if pulls:
+            await db.users.bulk_write(pulls, ordered=False)
+            pulls = []
+
+    cursor = db.users.find({"tasks.0": {"$exists": True}}, {"tasks": 1})
+    async for user in cursor:
+        for task in user["tasks"]:
+            doc = {**task, "user_id": user["_id"]}
+            doc.setdefault("did_task", False)
+            ops.append(ReplaceOne({"_id": task["_id"]}, doc, upsert=True))
+            if len(ops) >= batch_size:
+                await flush()
+        if unset:
+            copied = [task["_id"] for task in user["tasks"]]
+            pulls.append(UpdateOne({"_id": user["_id"]}, {"$pull": {"tasks": {"_id": {"$in": copied}}}}))
+    await flush()
+    return migrated
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Move embedded user tasks into the tasks collection")
+    arg_parser.add_argument("--batch-size", type=int, default=1000)
+    arg_parser.add_argument("--unset", action="store_true", help="remove copied tasks from users.tasks")
+    args = arg_parser.parse_args()
+
+    async def run() -> int:
+        try:
+            return await migrate(data_access.get_db(), batch_size=args.batch_size, unset=args.unset)
+        finally:
+            await data_access.close()
+
+    print(f"Migrated {asyncio.run(run())} tasks")
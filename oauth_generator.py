@@ -1,17 +1,14 @@
 #!/usr/bin/env python3
 import os
-import json
-import requests
 import tweepy
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from bson.objectid import ObjectId
+from asi1_stream import stream_completion
 
 # ───────────────────────────────────────────────────────────
 # Load environment variables
 load_dotenv()
-ASI1_API_KEY = os.getenv("ASI1_API_KEY")
-ASI1_API_URL = "https://api.asi1.ai/v1/chat/completions"
 TWITTER_API_KEY = os.getenv("TWITTER_API_KEY")
 TWITTER_API_SECRET = os.getenv("TWITTER_API_SECRET")
 
@@ -54,40 +51,11 @@ def generate_tweet():
     """
     Generate a tweet by streaming from the ASI1 Mini model.
     """
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {ASI1_API_KEY}'
-    }
-    payload = {
-        "model": "asi1-mini",
-        "messages": [{"role": "user", "content": (
-            "I failed to complete a task on time. Generate pure text with no quotation marks that could be tweeted that is a few sentences long that is extremely self deprecating because of this. Should not be funny, just very rude to myself. Generate only the tweet and no other text. Make sure it is purely text and is not surrounded by quotation marks."
-        )}],
-        "temperature": 0.7,
-        "stream": True,
-        "max_tokens": 280
-    }
-    response = requests.post(
-        ASI1_API_URL,
-        headers=headers,
-        data=json.dumps(payload),
-        stream=True
+    tweet, stats = stream_completion(
+        "I failed to complete a task on time. Generate pure text with no quotation marks that could be tweeted that is a few sentences long that is extremely self deprecating because of this. Should not be funny, just very rude to myself. Generate only the tweet and no other text. Make sure it is purely text and is not surrounded by quotation marks."
     )
-    tweet_text = ""
-    for chunk in response.iter_lines():
-        if not chunk:
-            continue
-        if chunk.startswith(b"data: "):
-            payload_chunk = chunk[len(b"data: "):]
-            if payload_chunk == b"[DONE]":
-                break
-            data = json.loads(payload_chunk)
-            delta = data["choices"][0].get("delta", {})
-            content = delta.get("content")
-            if content:
-                tweet_text += content
-    return tweet_text.strip()
+    print(f"First token after {stats.first_token_s or 0:.2f}s, stream took {stats.total_s:.2f}s")
+    return tweet
 
 
 def post_to_twitter(tweet_text, oauth_token, oauth_token_secret):
@@ -0,0 +1,423 @@
+"""
+Structured logging and Prometheus metrics for main.py and backend.py.
+
+Logging goes through the standard `logging` module. `start_logging` sends
+every record through a queue to a background thread, which writes one JSON
+object per line (or plain text) to stdout, so a log call on a request path
+never waits on the terminal. Records below LOG_LEVEL are dropped after a
+cached level check. Pass structured fields with `extra=fields(...)`, use
+%-style arguments, and guard anything costly to build with `log.isEnabledFor`.
+
+Metrics are kept in process and rendered in the Prometheus text format by
+`render_metrics` (served on /metrics):
+
+- `MetricsMiddleware` records per-route request latency and in-flight requests.
+- `track(dependency, operation)` times calls to Gemini, Stripe, Twilio,
+  Twitter and bcrypt.
+- `MongoCommandMetrics` is a PyMongo command listener (see data_access.py)
+  that times every MongoDB command.
+- `add_stats` exports an existing `stats()` dict as gauges at scrape time.
+
+    LOG_LEVEL    DEBUG, INFO, WARNING or ERROR (default INFO)
+    LOG_FORMAT   json or text (default json)
+"""
+import atexit
+import bisect
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
+from pymongo import monitoring
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Seconds; covers a cache hit up to a slow Gemini call with retries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Logging ---
+
+def fields(**values: Any) -> Dict[str, Any]:
+    """Structured fields for a log call: `log.info("msg", extra=fields(user_id=...))`."""
+    return {"fields": values}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = getattr(record, "fields", None)
+        if extra:
+            line += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        return line
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records as they are. The stock handler formats them first, which
+    folds tracebacks into the message; the writer thread formats instead, so
+    JsonFormatter still sees exc_info.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Route all logging through a background writer. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=False)
+    _listener.start()
+    root = logging.getLogger()
+    root.handlers = [_LocalQueueHandler(records)]
+    root.setLevel(level)
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# --- Metrics ---
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values: str, **named: str) -> Any:
+        key = tuple(str(v) for v in values) if values else tuple(str(named[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_number(child.value)}"
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def add_stats(self, prefix: str, collect: Callable[[], Dict[str, Any]]) -> None:
+        self._stats[prefix] = collect
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for prefix, collect in list(self._stats.items()):
+            try:
+                stats = collect()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Stats for %s failed: %s", prefix, e)
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def add_stats(prefix: str, collect: Callable[[], Dict[str, Any]]) -> None:
+    """Export a component's stats() dict (numeric entries only) as `<prefix>_<key>` gauges."""
+    REGISTRY.add_stats(prefix, collect)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("service", "method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled", ("service",))
+WEBSOCKETS_OPEN = Gauge("websocket_connections_open", "Open WebSocket connections", ("service",))
+DEPENDENCY_SECONDS = Histogram(
+    "dependency_call_duration_seconds", "Time spent in calls to external services",
+    ("dependency", "operation", "outcome"),
+)
+DEPENDENCY_IN_FLIGHT = Gauge("dependency_calls_in_flight", "Calls to external services in progress", ("dependency",))
+
+
+@contextmanager
+def track(dependency: str, operation: str) -> Iterator[None]:
+    """
+    Time a call to an external service. Works around sync code and around
+    awaits: `with track("stripe", "customer.create"): ...`.
+    """
+    in_flight = DEPENDENCY_IN_FLIGHT.labels(dependency)
+    in_flight.inc()
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        DEPENDENCY_SECONDS.labels(dependency, operation, outcome).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command the client sends, by command name."""
+
+    def __init__(self) -> None:
+        self._in_flight = DEPENDENCY_IN_FLIGHT.labels("mongo")
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self._in_flight.inc()
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._in_flight.dec()
+        DEPENDENCY_SECONDS.labels("mongo", event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._in_flight.dec()
+        DEPENDENCY_SECONDS.labels("mongo", event.command_name, "error").observe(event.duration_micros / 1e6)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency per route template (so /tasks/{user_id}
+    is one series), in-flight requests and open WebSockets.
+    """
+
+    def __init__(self, app: Any, service: str):
+        self.app = app
+        self.service = service
+        self.in_flight = HTTP_IN_FLIGHT.labels(service)
+        self.websockets = WEBSOCKETS_OPEN.labels(service)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] == "websocket":
+            self.websockets.inc()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.websockets.dec()
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(self.service, scope["method"], route_template(scope), str(status)).observe(
+                time.perf_counter() - start)
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """The matched route's path template; mounts and unmatched paths collapse to one value each."""
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    if scope.get("app_root_path") is not None or scope.get("root_path"):
+        return scope.get("root_path") or "<mount>"
+    return "<unmatched>"
+
+
+# Microbenchmark: per-call cost of the instrumentation on the request path
+if __name__ == "__main__":
+    import io
+    from contextlib import redirect_stdout
+
+    CALLS = 100_000
+    log = logging.getLogger("bench")
+
+    def bench(label: str, fn: Callable[[int], None]) -> None:
+        start = time.perf_counter()
+        for i in range(CALLS):
+            fn(i)
+        print(f"{label:<34} {(time.perf_counter() - start) / CALLS * 1e9:8.0f} ns/call")
+
+    sink = io.StringIO()
+    with redirect_stdout(sink):
+        start = time.perf_counter()
+        for i in range(CALLS):
+            print(f"Updating task {i} for user {i}")
+        elapsed = time.perf_counter() - start
+    print(f"{'print to a buffer':<34} {elapsed / CALLS * 1e9:8.0f} ns/call")
+
+    # The writer thread's output goes nowhere, so this times the formatting, not a terminal
+    devnull = open(os.devnull, "w")
+    with redirect_stdout(devnull):
+        start_logging(level="INFO")
+    bench("log.debug below LOG_LEVEL", lambda i: log.debug("Updating task %s for user %s", i, i))
+    bench("log.info queued (JSON)", lambda i: log.info("Task verified", extra=fields(task_id=i)))
+    stop_logging()
+    devnull.close()
+
+    histogram = Histogram("bench_seconds", "benchmark", ("route",))
+    bench("histogram observe", lambda i: histogram.labels("/tasks/{user_id}").observe(0.012))
+
+    def tracked(i: int) -> None:
+        with track("bench", "noop"):
+            pass
+
+    bench("track() around a call", tracked)
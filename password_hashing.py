@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+bcrypt for /register and /login on a dedicated, bounded thread pool.
+
+bcrypt is deliberately slow (~300 ms at cost 12) and releases the GIL, so it
+is safe to run on threads, but not on the shared threadpool that the task
+and verification endpoints also use: a login burst would occupy every slot.
+Hashes run on their own BCRYPT_WORKERS threads. Once BCRYPT_MAX_PENDING are
+queued, further attempts get a 503 with Retry-After instead of queueing.
+
+Stored hashes record their cost, so changing BCRYPT_ROUNDS takes effect
+gradually: a successful login with an older cost is rehashed in the
+background.
+
+    BCRYPT_ROUNDS       work factor for new hashes (default 12)
+    BCRYPT_WORKERS      threads hashing at once (default half the CPUs, at least 1)
+    BCRYPT_MAX_PENDING  hashes queued or running before new ones are refused (default 64)
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+import bcrypt
+from fastapi import HTTPException
+
+from observability import track
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", 64))
+
+
+def hash_cost(hashed: bytes) -> int:
+    """Work factor of a stored bcrypt hash ($2b$<cost>$...)."""
+    return int(hashed[4:6])
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = BCRYPT_WORKERS,
+                 max_pending: int = BCRYPT_MAX_PENDING):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.hashes = 0
+        self.checks = 0
+        self.rehashes = 0
+        self.rejected = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(503, "Too many sign-ins in progress, please retry", headers={"Retry-After": "1"})
+        self.pending += 1
+        queued = time.perf_counter()
+
+        def timed() -> Any:
+            started = time.perf_counter()
+            try:
+                with track("bcrypt", fn.__name__):
+                    return fn(*args)
+            finally:
+                self.completed += 1
+                self.wait_seconds += started - queued
+                self.busy_seconds += time.perf_counter() - started
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> bytes:
+        self.hashes += 1
+        return await self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+
+    async def verify(self, password: str, hashed: bytes) -> bool:
+        self.checks += 1
+        return await self._run(bcrypt.checkpw, password.encode("utf-8"), hashed)
+
+    def needs_rehash(self, hashed: bytes) -> bool:
+        return hash_cost(hashed) != self.rounds
+
+    async def rehash(self, db: Any, user_id: Any, password: str, old_hash: bytes) -> None:
+        """Store a hash at the current cost, unless the password changed meanwhile."""
+        try:
+            new_hash = await self.hash(password)
+        except HTTPException:
+            # Busy: try again on a later login
+            return
+        await db.users.update_one({"_id": user_id, "password": old_hash}, {"$set": {"password": new_hash}})
+        self.rehashes += 1
+
+    def stats(self) -> Dict[str, float]:
+        done = self.completed
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "pending": self.pending,
+            "hashes": self.hashes,
+            "checks": self.checks,
+            "rehashes": self.rehashes,
+            "rejected": self.rejected,
+            "avg_hash_ms": self.busy_seconds / done * 1000 if done > 0 else 0.0,
+            "avg_wait_ms": self.wait_seconds / done * 1000 if done > 0 else 0.0,
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Benchmark: a burst of logins on the shared threadpool vs the dedicated pool
+# at several worker counts, while another endpoint keeps using the shared
+# threadpool for short jobs. Reports login throughput and that endpoint's latency.
+if __name__ == "__main__":
+    import argparse
+
+    from starlette.concurrency import run_in_threadpool
+
+    arg_parser = argparse.ArgumentParser(description="Login throughput benchmark")
+    arg_parser.add_argument("--logins", type=int, default=60)
+    arg_parser.add_argument("--rounds", type=int, default=10)
+    arg_parser.add_argument("--workers", default="1,2,4,8")
+    args = arg_parser.parse_args()
+
+    stored = bcrypt.hashpw(b"correct horse", bcrypt.gensalt(args.rounds))
+
+    def short_job() -> None:
+        # Stands in for the small blocking steps of a task or verification request
+        sum(range(20_000))
+
+    async def probe(stop: asyncio.Event, latencies: list) -> None:
+        while not stop.is_set():
+            start = time.perf_counter()
+            await run_in_threadpool(short_job)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    async def burst(login: Callable[[], Any]) -> Tuple[float, float, float]:
+        stop = asyncio.Event()
+        latencies: list = []
+        prober = asyncio.create_task(probe(stop, latencies))
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+        return elapsed, p50, p99
+
+    async def run() -> None:
+        print(f"{args.logins} concurrent logins at cost {args.rounds} on {os.cpu_count()} CPUs")
+        print(f"{'pool':<22} {'logins/s':>9} {'other p50 ms':>13} {'other p99 ms':>13}")
+        elapsed, p50, p99 = await burst(lambda: run_in_threadpool(bcrypt.checkpw, b"correct horse", stored))
+        print(f"{'shared threadpool':<22} {args.logins / elapsed:9.1f} {p50:13.1f} {p99:13.1f}")
+        for workers in (int(w) for w in args.workers.split(",")):
+            hasher = PasswordHasher(args.rounds, workers, max_pending=args.logins)
+            elapsed, p50, p99 = await burst(lambda: hasher.verify("correct horse", stored))
+            hasher.close()
+            print(f"{f'dedicated, {workers} workers':<22} {args.logins / elapsed:9.1f} {p50:13.1f} {p99:13.1f}")
+
+    asyncio.run(run())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Prompt templates loaded once from prompts/ and rendered per call.
+
+Each prompts/<name>.txt file is parsed into literal chunks and {field}
+placeholders (str.format syntax, {{ and }} for literal braces) when it is
+loaded, so rendering is a single join. Files are re-read only when their
+mtime changes, checked at most every PROMPT_RELOAD_INTERVAL seconds, so
+prompts can be edited without restarting the server.
+
+    PROMPT_DIR              template directory (default prompts/ next to this file)
+    PROMPT_RELOAD_INTERVAL  seconds between mtime checks per template (default 2)
+"""
+import logging
+import os
+import string
+import time
+from typing import Dict, List, Optional, Tuple
+
+from observability import fields
+
+PROMPT_DIR = os.getenv("PROMPT_DIR", os.path.join(os.path.dirname(os.path.realpath(__file__)), "prompts"))
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", 2))
+
+log = logging.getLogger(__name__)
+
+
+class PromptTemplate:
+    def __init__(self, name: str, text: str, mtime: float):
+        self.name = name
+        self.text = text
+        self.mtime = mtime
+        # Alternating literal text and field names; a None field marks the end of the template
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if spec or conversion:
+                raise ValueError(f"Prompt {name}: format specs and conversions are not supported ({field})")
+            self.parts.append((literal, field))
+        self.fields = {field for _, field in self.parts if field is not None}
+
+    def render(self, **values: str) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt {self.name} is missing values for: {', '.join(sorted(missing))}")
+        chunks = []
+        for literal, field in self.parts:
+            chunks.append(literal)
+            if field is not None:
+                chunks.append(str(values[field]))
+        return "".join(chunks)
+
+
+class PromptRegistry:
+    def __init__(self, directory: str = PROMPT_DIR, reload_interval: float = PROMPT_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._checked: Dict[str, float] = {}
+        # name -> (renders, total chars, last chars) for tracking prompt length
+        self.rendered_sizes: Dict[str, Tuple[int, int, int]] = {}
+        self.reloads = 0
+
+    def load_all(self) -> None:
+        for file_name in sorted(os.listdir(self.directory)):
+            if file_name.endswith(".txt"):
+                self._load(file_name[:-4])
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.txt")
+
+    def _load(self, name: str) -> PromptTemplate:
+        path = self._path(name)
+        try:
+            mtime = os.stat(path).st_mtime
+            with open(path, "r", encoding="utf-8") as file:
+                template = PromptTemplate(name, file.read(), mtime)
+        except FileNotFoundError:
+            log.warning("Could not find prompt file", extra=fields(prompt=name, path=path))
+            raise
+        if name in self._templates:
+            self.reloads += 1
+            log.info("Reloaded prompt %s", name, extra=fields(prompt=name, reloads=self.reloads))
+        self._templates[name] = template
+        self._checked[name] = time.monotonic()
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        template = self._templates.get(name)
+        if template is None:
+            return self._load(name)
+        now = time.monotonic()
+        if now - self._checked[name] >= self.reload_interval:
+            self._checked[name] = now
+            try:
+                changed = os.stat(self._path(name)).st_mtime != template.mtime
+            except FileNotFoundError:
+                # Keep serving the last good version if the file is mid-replace
+                changed = False
+            if changed:
+                return self._load(name)
+        return template
+
+    def render(self, name: str, /, **values: str) -> str:
+        prompt = self.get(name).render(**values)
+        renders, total, _ = self.rendered_sizes.get(name, (0, 0, 0))
+        self.rendered_sizes[name] = (renders + 1, total + len(prompt), len(prompt))
+        return prompt
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"renders": renders, "avg_chars": total / renders, "last_chars": last}
+            for name, (renders, total, last) in self.rendered_sizes.items()
+        }
+
+
+# Benchmark: rendering from the registry vs rebuilding the prompt from disk each call
+if __name__ == "__main__":
+    RENDERS = 100_000
+    registry = PromptRegistry(reload_interval=2)
+    registry.load_all()
+    values = {"task": "Make the bed", "time_remaining": "2 hours"}
+
+    start = time.perf_counter()
+    for _ in range(RENDERS // 10):
+        with open(registry._path("call_prompt"), encoding="utf-8") as f:
+            f.read().format(**values)
+    per_read = (time.perf_counter() - start) / (RENDERS // 10)
+
+    start = time.perf_counter()
+    for _ in range(RENDERS):
+        prompt = registry.render("call_prompt", **values)
+    per_render = (time.perf_counter() - start) / RENDERS
+
+    print(f"read + format per call: {per_read * 1e6:7.2f} us")
+    print(f"registry render:        {per_render * 1e6:7.2f} us")
+    print(f"rendered size: {len(prompt)} chars, stats {registry.stats()}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Shared Twilio, Stripe and Twitter clients for backend.py.
+
+Each provider gets one pooled requests.Session with keep-alive, created once
+at startup, so handlers reuse warm TLS connections instead of building a new
+client (and handshake) per request. Tweepy clients carry per-user OAuth
+tokens, so they are cached per token pair with LRU eviction and all share a
+single session.
+
+    PROVIDER_POOL_SIZE   keep-alive connections per provider host (default 32)
+    PROVIDER_TIMEOUT     request timeout in seconds (default 30)
+    TWEEPY_CACHE_SIZE    cached per-user tweepy clients (default 256)
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import requests
+import stripe
+import tweepy
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+PROVIDER_POOL_SIZE = int(os.getenv("PROVIDER_POOL_SIZE", 32))
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", 30))
+TWEEPY_CACHE_SIZE = int(os.getenv("TWEEPY_CACHE_SIZE", 256))
+
+
+def pooled_session(pool_size: int = PROVIDER_POOL_SIZE) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ProviderClients:
+    def __init__(
+        self,
+        twilio_account_sid: Optional[str],
+        twilio_auth_token: Optional[str],
+        stripe_key: Optional[str],
+        twitter_api_key: Optional[str],
+        twitter_api_secret: Optional[str],
+        pool_size: int = PROVIDER_POOL_SIZE,
+        timeout: float = PROVIDER_TIMEOUT,
+        tweepy_cache_size: int = TWEEPY_CACHE_SIZE,
+    ):
+        self.twilio_http = TwilioHttpClient(timeout=timeout)
+        self.twilio_http.session = pooled_session(pool_size)
+        self.twilio = Client(twilio_account_sid, twilio_auth_token, http_client=self.twilio_http)
+
+        # stripe is configured module-wide, so this runs once per process
+        self.stripe_session = pooled_session(pool_size)
+        stripe.api_key = stripe_key
+        stripe.default_http_client = stripe.RequestsClient(session=self.stripe_session, timeout=timeout)
+
+        self.twitter_api_key = twitter_api_key
+        self.twitter_api_secret = twitter_api_secret
+        self.twitter_session = pooled_session(pool_size)
+        self.tweepy_cache_size = tweepy_cache_size
+        self._tweepy: "OrderedDict[Tuple[str, str], tweepy.Client]" = OrderedDict()
+        self._tweepy_lock = threading.Lock()
+
+    def tweepy_client(self, access_token: str, access_token_secret: str) -> tweepy.Client:
+        """Return the cached client for a user's tokens, creating it on first use."""
+        key = (access_token, access_token_secret)
+        with self._tweepy_lock:
+            client = self._tweepy.get(key)
+            if client is not None:
+                self._tweepy.move_to_end(key)
+                return client
+            client = tweepy.Client(
+                consumer_key=self.twitter_api_key,
+                consumer_secret=self.twitter_api_secret,
+                access_token=access_token,
+                access_token_secret=access_token_secret,
+            )
+            # OAuth is signed per request, so every user can share one connection pool
+            client.session.close()
+            client.session = self.twitter_session
+            self._tweepy[key] = client
+            while len(self._tweepy) > self.tweepy_cache_size:
+                self._tweepy.popitem(last=False)
+            return client
+
+    def close(self) -> None:
+        self.twilio_http.session.close()
+        self.stripe_session.close()
+        self.twitter_session.close()
+
+
+# Connection count check against a local stand-in server
+if __name__ == "__main__":
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    REQUESTS = 1000
+    connections = 0
+    connections_lock = threading.Lock()
+
+    class StandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send headers and body in one write; split writes can stall keep-alive clients
+        wbufsize = -1
+
+        def setup(self):
+            global connections
+            with connections_lock:
+                connections += 1
+            super().setup()
+
+        def do_GET(self):
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.daemon_threads = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    def count(label: str, send) -> None:
+        global connections
+        connections = 0
+        for _ in range(REQUESTS):
+            send()
+        print(f"{label:<40} {connections:>5} connections / {REQUESTS} requests")
+
+    providers = ProviderClients("ACxxx", "token", "sk_test", "key", "secret", timeout=5)
+
+    # Twilio: a new Client (and TwilioHttpClient) per request vs the shared one
+    def twilio_per_request():
+        client = TwilioHttpClient(timeout=5)
+        client.request("GET", url)
+        client.session.close()
+
+    def stripe_per_request():
+        client = stripe.RequestsClient(timeout=5)
+        client.request("get", url, {})
+        client.close()
+
+    def tweepy_per_request():
+        client = tweepy.Client("token")
+        client.session.get(url, timeout=5)
+        client.session.close()
+
+    count("twilio, client per request", twilio_per_request)
+    count("twilio, shared registry client", lambda: providers.twilio_http.request("GET", url))
+
+    # Stripe: the RequestsClient requests go through
+    count("stripe, client per request", stripe_per_request)
+    count("stripe, shared registry client", lambda: stripe.default_http_client.request("get", url, {}))
+
+    # Tweepy: a new tweepy.Client per request vs the cached per-user client
+    count("tweepy, client per request", tweepy_per_request)
+    count("tweepy, cached registry client", lambda: providers.tweepy_client("at", "ats").session.get(url, timeout=5))
+
+    providers.close()
+    server.shutdown()
@@ -1,7 +1,7 @@
 import os
-import requests
 from uagents import Agent, Model, Context
 from dotenv import load_dotenv
+import agent_http
 
 # Load environment variables
 load_dotenv()
@@ -9,21 +9,40 @@ load_dotenv()
 api_url = os.getenv('API_URL', f"{os.getenv('NGROK_URL')}/charge")
 
 agent = Agent()
+agent_http.install(agent)
 
 class StripeChargeRequest(Model):
     email: str
 
-@agent.on_message(model=StripeChargeRequest)
+class StripeChargeResult(Model):
+    email: str
+    success: bool
+    payment_intent: str = ""
+    error: str = ""
+
+@agent.on_message(model=StripeChargeRequest, replies={StripeChargeResult})
 async def handle_charge(ctx: Context, sender: str, req: StripeChargeRequest):
+    if not agent_http.run_in_background(ctx, charge(ctx, sender, req)):
+        ctx.logger.warning(f"Too many charges in flight, rejecting charge for {req.email}")
+        await ctx.send(sender, StripeChargeResult(email=req.email, success=False, error="Charge agent busy, retry later"))
+
+async def charge(ctx: Context, sender: str, req: StripeChargeRequest):
     try:
-        response = requests.post(api_url, json={"email": req.email})
-        result = response.json()
+        async with agent_http.get_session().post(api_url, json={"email": req.email}) as response:
+            result = await response.json()
         if result.get("success"):
-            ctx.logger.info(f"Charge successful: {result.get('payment_intent')}")
+            # /charge returns the whole PaymentIntent object; only its id goes back to the sender
+            intent_id = (result.get("payment_intent") or {}).get("id", "")
+            ctx.logger.info(f"Charge successful: {intent_id}")
+            reply = StripeChargeResult(email=req.email, success=True, payment_intent=intent_id)
         else:
             ctx.logger.error(f"Charge failed: {result.get('error')}")
+            reply = StripeChargeResult(email=req.email, success=False, error=str(result.get("error")))
     except Exception as e:
         ctx.logger.error(f"Error calling backend: {e}")
+        reply = StripeChargeResult(email=req.email, success=False, error=f"Error calling backend: {e}")
+    # Handlers return before the charge finishes, so the outcome goes back as a message
+    await ctx.send(sender, reply)
 
 if __name__ == "__main__":
     agent.run()
\ No newline at end of file
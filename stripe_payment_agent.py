@@ -1,7 +1,7 @@
 import os
-import requests
 from uagents import Agent, Model, Context
 from dotenv import load_dotenv
+import agent_http
 
 load_dotenv()
 
@@ -9,14 +9,25 @@ STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_API_URL = "https://api.stripe.com/v1/payment_intents"
 
 agent = Agent()
+agent_http.install(agent)
 
 class StripePaymentRequest(Model):
     payment_method_id: str   # Required, the payment method to charge
     customer_id: str = None  # Optional, if you want to charge a customer
     description: str = "Charge for $5"
 
-@agent.on_message(model=StripePaymentRequest)
+class StripePaymentResult(Model):
+    success: bool
+    payment_intent: str = ""
+    error: str = ""
+
+@agent.on_message(model=StripePaymentRequest, replies={StripePaymentResult})
 async def handle_payment(ctx: Context, sender: str, req: StripePaymentRequest):
+    if not agent_http.run_in_background(ctx, create_payment(ctx, sender, req)):
+        ctx.logger.warning("Too many payments in flight, rejecting payment")
+        await ctx.send(sender, StripePaymentResult(success=False, error="Payment agent busy, retry later"))
+
+async def create_payment(ctx: Context, sender: str, req: StripePaymentRequest):
     headers = {
         "Authorization": f"Bearer {STRIPE_SECRET_KEY}"
     }
@@ -31,11 +42,21 @@ async def handle_payment(ctx: Context, sender: str, req: StripePaymentRequest):
     if req.customer_id:
         data["customer"] = req.customer_id
 
-    response = requests.post(STRIPE_API_URL, headers=headers, data=data)
-    if response.status_code == 200:
-        ctx.logger.info(f"Payment successful: {response.json()}")
-    else:
-        ctx.logger.error(f"Payment failed: {response.text}")
+    try:
+        async with agent_http.get_session().post(STRIPE_API_URL, headers=headers, data=data) as response:
+            if response.status == 200:
+                intent = await response.json()
+                ctx.logger.info(f"Payment successful: {intent}")
+                reply = StripePaymentResult(success=True, payment_intent=intent.get("id", ""))
+            else:
+                detail = await response.text()
+                ctx.logger.error(f"Payment failed: {detail}")
+                reply = StripePaymentResult(success=False, error=detail[:500])
+    except Exception as e:
+        ctx.logger.error(f"Error calling Stripe: {e}")
+        reply = StripePaymentResult(success=False, error=f"Error calling Stripe: {e}")
+    # Handlers return before the payment finishes, so the outcome goes back as a message
+    await ctx.send(sender, reply)
 
 if __name__ == "__main__":
     agent.run() 
\ No newline at end of file
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+In-process index of pending tasks for the scheduler agent.
+
+The cache loads every user's contact fields and pending tasks once, then
+stays current by following a change stream on `users` (and `tasks` in
+collection mode). Scheduler refreshes read from memory instead of querying
+Atlas. The change stream is opened before the bootstrap query, so no write
+can fall between the two. It resumes from its last token after a network
+error and bootstraps again if the server no longer has that history.
+
+Window reads slice a due-date-sorted index. The cache also records which
+tasks changed since the scheduler last asked (`drain_changes`), so most
+refreshes only revisit those tasks instead of the whole window.
+
+On deployments without change streams (a standalone mongod), the cache polls
+for documents whose `updated_at` (stamped by TaskStore writes) moved since
+the last poll. Because deletions are invisible to polling, it also resyncs
+fully every TASK_CACHE_RESYNC_INTERVAL seconds.
+
+TaskCache exposes the TaskStore methods the scheduler uses, so it can be
+passed to TaskScheduler.refresh in place of the store. Watermark writes go
+straight through to Mongo.
+
+    TASK_CACHE_MODE             auto, changestream or poll (default auto)
+    TASK_CACHE_POLL_INTERVAL    seconds between polls in poll mode (default 5)
+    TASK_CACHE_RESYNC_INTERVAL  seconds between full reloads in poll mode (default 3600)
+    TASK_CACHE_MAX_CHANGES      changed tasks tracked between drains before asking for a full refresh (default 10000)
+"""
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from observability import fields
+from task_scheduler import to_utc
+from task_store import COLLECTION, NOT_DONE, USER_CONTACT_PROJECTION, WATERMARK_FIELDS, TaskStore
+
+TASK_CACHE_MODE = os.getenv("TASK_CACHE_MODE", "auto")
+TASK_CACHE_POLL_INTERVAL = float(os.getenv("TASK_CACHE_POLL_INTERVAL", 5))
+TASK_CACHE_RESYNC_INTERVAL = float(os.getenv("TASK_CACHE_RESYNC_INTERVAL", 3600))
+TASK_CACHE_MAX_CHANGES = int(os.getenv("TASK_CACHE_MAX_CHANGES", 10000))
+
+# Task fields the scheduler needs
+TASK_FIELDS = ("_id", "description", "due_date", "did_task") + WATERMARK_FIELDS
+
+# Server errors meaning change streams are not available on this deployment
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324, 136}  # not a replica set, unknown stage, majority read concern off
+CHANGE_STREAM_HISTORY_LOST = {286, 280}  # resume point fell off the oplog, invalid resume token
+
+log = logging.getLogger(__name__)
+
+# Polls look back this far to cover writes that committed while the previous poll ran
+POLL_OVERLAP = timedelta(seconds=2)
+
+
+def deep_size(value: Any, seen: Optional[Set[int]] = None) -> int:
+    """Approximate bytes held by a document, counting shared objects once."""
+    seen = seen if seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in value)
+    return size
+
+
+class TaskCache:
+    def __init__(
+        self,
+        store: TaskStore,
+        mode: str = TASK_CACHE_MODE,
+        poll_interval: float = TASK_CACHE_POLL_INTERVAL,
+        resync_interval: float = TASK_CACHE_RESYNC_INTERVAL,
+    ):
+        if mode not in ("auto", "changestream", "poll"):
+            raise ValueError(f"Unknown TASK_CACHE_MODE: {mode}")
+        self.store = store
+        self.db = store.db
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.resync_interval = resync_interval
+        self._users: Dict[Any, Dict[str, Any]] = {}  # user _id -> contact fields
+        self._tasks: Dict[Any, Dict[str, Any]] = {}  # task _id -> pending task, with user_id
+        self._user_tasks: Dict[Any, Set[Any]] = {}  # user _id -> pending task ids
+        # Sorted (due timestamp, task _id) of every pending task; None while a resync rebuilds it
+        self._due: Optional[List[Tuple[float, Any]]] = []
+        # Task ids added, changed or dropped since the last drain_changes; None after a resync or overflow
+        self._changed: Optional[Set[Any]] = set()
+        self._runner: Optional[asyncio.Task] = None
+        self.ready = asyncio.Event()
+        self.source: Optional[str] = None
+        self.changes_applied = 0
+        self.resyncs = 0
+        self.bootstrap_ms = 0.0
+        self.lag_total = 0.0
+        self.lag_count = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    # Applying documents
+
+    def _set_task(self, user_id: Any, task: Dict[str, Any]) -> None:
+        task_id = task["_id"]
+        if task.get("did_task") or task.get("due_date") is None:
+            self._drop_task(task_id)
+            return
+        cached = {f: task.get(f) for f in TASK_FIELDS if f in task}
+        cached["due_date"] = to_utc(task["due_date"])
+        cached["user_id"] = user_id
+        previous = self._tasks.get(task_id)
+        if previous is not None and previous["user_id"] != user_id:
+            self._user_tasks.get(previous["user_id"], set()).discard(task_id)
+        if previous is None or previous["due_date"] != cached["due_date"]:
+            if previous is not None:
+                self._unindex(previous["due_date"], task_id)
+            if self._due is not None:
+                bisect.insort(self._due, (cached["due_date"].timestamp(), task_id))
+        if previous != cached:
+            self._mark_changed(task_id)
+        self._tasks[task_id] = cached
+        self._user_tasks.setdefault(user_id, set()).add(task_id)
+
+    def _unindex(self, due_date: datetime, task_id: Any) -> None:
+        if self._due is None:
+            return
+        key = (due_date.timestamp(), task_id)
+        i = bisect.bisect_left(self._due, key)
+        if i < len(self._due) and self._due[i] == key:
+            del self._due[i]
+
+    def _mark_changed(self, task_id: Any) -> None:
+        if self._changed is None:
+            return
+        self._changed.add(task_id)
+        if len(self._changed) > TASK_CACHE_MAX_CHANGES:
+            self._changed = None
+
+    def _drop_task(self, task_id: Any) -> None:
+        task = self._tasks.pop(task_id, None)
+        if task is not None:
+            self._unindex(task["due_date"], task_id)
+            self._mark_changed(task_id)
+            task_ids = self._user_tasks.get(task["user_id"])
+            if task_ids is not None:
+                task_ids.discard(task_id)
+                if not task_ids:
+                    del self._user_tasks[task["user_id"]]
+
+    def _set_user(self, user: Dict[str, Any]) -> None:
+        user_id = user["_id"]
+        self._users[user_id] = {k: user.get(k) for k in USER_CONTACT_PROJECTION}
+        if self.store.mode != COLLECTION:
+            # Embedded tasks arrive with the whole user document, so replace the set
+            keep = set()
+            for task in user.get("tasks") or []:
+                self._set_task(user_id, task)
+                keep.add(task["_id"])
+            for task_id in self._user_tasks.get(user_id, set()) - keep:
+                self._drop_task(task_id)
+
+    def _drop_user(self, user_id: Any) -> None:
+        self._users.pop(user_id, None)
+        for task_id in list(self._user_tasks.get(user_id, ())):
+            self._drop_task(task_id)
+
+    def _record_lag(self, written_at: Optional[datetime]) -> None:
+        if written_at is None:
+            return
+        lag = max(0.0, time.time() - to_utc(written_at).timestamp())
+        self.lag_last = lag
+        self.lag_max = max(self.lag_max, lag)
+        self.lag_total += lag
+        self.lag_count += 1
+
+    def apply_change(self, change: Dict[str, Any]) -> None:
+        """Apply one change stream event (opened with full_document="updateLookup")."""
+        operation = change["operationType"]
+        collection = change["ns"]["coll"]
+        key = change["documentKey"]["_id"]
+        document = change.get("fullDocument")
+        if collection == "users":
+            if operation == "delete" or document is None:
+                self._drop_user(key)
+            else:
+                self._set_user(document)
+        elif collection == "tasks":
+            if operation == "delete" or document is None:
+                self._drop_task(key)
+            else:
+                self._set_task(document.get("user_id"), document)
+        self.changes_applied += 1
+        # wallTime needs MongoDB 6.0; clusterTime has second resolution
+        written_at = change.get("wallTime")
+        if written_at is None and change.get("clusterTime") is not None:
+            written_at = datetime.fromtimestamp(change["clusterTime"].time, timezone.utc)
+        self._record_lag(written_at)
+
+    # Loading
+
+    def _user_projection(self) -> Dict[str, int]:
+        projection = dict(USER_CONTACT_PROJECTION)
+        if self.store.mode != COLLECTION:
+            projection.update({f"tasks.{f}": 1 for f in TASK_FIELDS})
+        return projection
+
+    async def resync(self) -> None:
+        """Reload every user and pending task."""
+        start = time.perf_counter()
+        users = await self.db.users.find({}, self._user_projection()).to_list(None)
+        tasks = []
+        if self.store.mode == COLLECTION:
+            cursor = self.db.tasks.find({"did_task": NOT_DONE}, {**{f: 1 for f in TASK_FIELDS}, "user_id": 1})
+            tasks = await cursor.to_list(None)
+        # Rebuild without awaiting, so a scheduler refresh never sees a half-loaded cache.
+        # The due index is sorted once at the end instead of per insert.
+        self._users, self._tasks, self._user_tasks, self._due = {}, {}, {}, None
+        for user in users:
+            self._set_user(user)
+        for task in tasks:
+            self._set_task(task["user_id"], task)
+        self._due = sorted((task["due_date"].timestamp(), task_id) for task_id, task in self._tasks.items())
+        # Anything may have changed; the next refresh has to read the whole window
+        self._changed = None
+        self.resyncs += 1
+        self.bootstrap_ms = (time.perf_counter() - start) * 1000
+        log.info("Task cache loaded %d users and %d pending tasks in %.0f ms",
+                 len(self._users), len(self._tasks), self.bootstrap_ms,
+                 extra=fields(users=len(self._users), tasks=len(self._tasks), bootstrap_ms=self.bootstrap_ms))
+
+    def _pipeline(self) -> List[Dict[str, Any]]:
+        collections = ["users", "tasks"] if self.store.mode == COLLECTION else ["users"]
+        document_fields = {f"fullDocument.{f}": 1 for f in self._user_projection()}
+        if self.store.mode == COLLECTION:
+            document_fields.update({f"fullDocument.{f}": 1 for f in TASK_FIELDS + ("user_id",)})
+        return [
+            {"$match": {"ns.coll": {"$in": collections},
+                        "operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+            # Only ship the fields the cache keeps; _id (the resume token) is kept automatically
+            {"$project": {"operationType": 1, "ns": 1, "documentKey": 1, "clusterTime": 1, "wallTime": 1,
+                          **document_fields}},
+        ]
+
+    async def _watch(self) -> None:
+        resume_token = None
+        while True:
+            try:
+                stream = await self.db.watch(self._pipeline(), full_document="updateLookup",
+                                             resume_after=resume_token)
+                async with stream:
+                    if resume_token is None:
+                        # Bootstrap after the stream is open, so writes in between are replayed
+                        await self.resync()
+                        resume_token = stream.resume_token
+                        self.source = "changestream"
+                        self.ready.set()
+                    async for change in stream:
+                        self.apply_change(change)
+                        resume_token = stream.resume_token
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED and not self.ready.is_set():
+                    raise
+                if e.code in CHANGE_STREAM_HISTORY_LOST:
+                    log.warning("Task cache change stream lost its resume point, reloading: %s", e,
+                                extra=fields(code=e.code))
+                    resume_token = None
+                    continue
+                log.warning("Task cache change stream failed, retrying: %s", e, extra=fields(code=e.code))
+                await asyncio.sleep(1)
+            except PyMongoError as e:
+                # Network errors: resume from the last token we applied
+                log.warning("Task cache change stream interrupted, resuming: %s", e)
+                await asyncio.sleep(1)
+
+    async def _poll(self) -> None:
+        await self.resync()
+        since = datetime.now(timezone.utc) - POLL_OVERLAP
+        next_resync = time.monotonic() + self.resync_interval
+        self.source = "poll"
+        self.ready.set()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            started = datetime.now(timezone.utc)
+            try:
+                if time.monotonic() >= next_resync:
+                    await self.resync()
+                    next_resync = time.monotonic() + self.resync_interval
+                else:
+                    changed = {"updated_at": {"$gt": since}}
+                    async for user in self.db.users.find(changed, {**self._user_projection(), "updated_at": 1}):
+                        self._set_user(user)
+                        self.changes_applied += 1
+                        self._record_lag(user.get("updated_at"))
+                    if self.store.mode == COLLECTION:
+                        cursor = self.db.tasks.find(changed, {**{f: 1 for f in TASK_FIELDS}, "user_id": 1, "updated_at": 1})
+                        async for task in cursor:
+                            self._set_task(task["user_id"], task)
+                            self.changes_applied += 1
+                            self._record_lag(task.get("updated_at"))
+            except PyMongoError as e:
+                log.warning("Task cache poll failed, retrying: %s", e)
+                continue
+            since = started - POLL_OVERLAP
+
+    async def _run(self) -> None:
+        if self.mode != "poll":
+            try:
+                await self._watch()
+                return
+            except OperationFailure as e:
+                if self.mode == "changestream":
+                    raise
+                log.warning("Change streams unavailable, polling updated_at instead", extra=fields(code=e.code))
+        await self._poll()
+
+    async def start(self) -> None:
+        """Bootstrap and keep following changes in the background. Returns once loaded."""
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+        ready = asyncio.create_task(self.ready.wait())
+        await asyncio.wait({ready, self._runner}, return_when=asyncio.FIRST_COMPLETED)
+        if not self.ready.is_set():
+            ready.cancel()
+            # The runner stopped before loading anything; surface its error
+            await self._runner
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    # TaskStore interface used by TaskScheduler
+
+    async def users_with_tasks_due(self, lo: datetime, hi: datetime) -> AsyncIterator[Dict[str, Any]]:
+        """Same contract as TaskStore.users_with_tasks_due, served from memory."""
+        due = self._due or []
+        start = bisect.bisect_left(due, lo.timestamp(), key=itemgetter(0))
+        end = bisect.bisect_right(due, hi.timestamp(), key=itemgetter(0))
+        grouped: Dict[Any, List[Dict[str, Any]]] = {}
+        for _, task_id in due[start:end]:
+            task = self._tasks[task_id]
+            grouped.setdefault(task["user_id"], []).append(task)
+        for user_id, tasks in grouped.items():
+            user = self._users.get(user_id)
+            if user is not None:
+                yield {**user, "tasks": tasks}
+
+    def drain_changes(self) -> Optional[Set[Any]]:
+        """
+        Task ids added, changed or dropped since the previous call, or None
+        when the caller has to reload its whole window (after a resync, or
+        more than TASK_CACHE_MAX_CHANGES changes).
+        """
+        changed, self._changed = self._changed, set()
+        return changed
+
+    async def users_with_changed_tasks(self, task_ids: Set[Any], lo: datetime,
+                                       hi: datetime) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Like users_with_tasks_due, limited to `task_ids`. Ids that were dropped
+        or moved out of the window are left out.
+        """
+        grouped: Dict[Any, List[Dict[str, Any]]] = {}
+        for task_id in task_ids:
+            task = self._tasks.get(task_id)
+            if task is not None and lo <= task["due_date"] <= hi:
+                grouped.setdefault(task["user_id"], []).append(task)
+        for user_id, tasks in grouped.items():
+            user = self._users.get(user_id)
+            if user is not None:
+                yield {**user, "tasks": tasks}
+
+    async def advance_watermark(self, user_id: Any, task_id: Any, due_ts: float,
+                                through_ts: float) -> Tuple[bool, Optional[float]]:
+        advanced, previous = await self.store.advance_watermark(user_id, task_id, due_ts, through_ts)
+        task = self._tasks.get(task_id)
+        if advanced and task is not None:
+            task["fired_due"], task["fired_through"] = due_ts, through_ts
+        return advanced, previous
+
+    async def init_watermarks(self, marks: List[Tuple[Any, Any, float, float]]) -> int:
+        return await self.store.init_watermarks(marks)
+
+    def stats(self, sample: int = 1000) -> Dict[str, Any]:
+        tasks = list(self._tasks.values())[:sample]
+        per_task = sum(deep_size(task) for task in tasks) / len(tasks) if tasks else 0.0
+        return {
+            "source": self.source,
+            "users": len(self._users),
+            "tasks": len(self._tasks),
+            "changes_applied": self.changes_applied,
+            "resyncs": self.resyncs,
+            "bootstrap_ms": self.bootstrap_ms,
+            "apply_lag_last_ms": self.lag_last * 1000,
+            "apply_lag_avg_ms": self.lag_total / self.lag_count * 1000 if self.lag_count else 0.0,
+            "apply_lag_max_ms": self.lag_max * 1000,
+            "bytes_per_task": per_task,
+        }
+
+
+# Check against a local replica set, e.g.
+#   mongod --replSet rs0 --dbpath /tmp/rs0 && mongosh --eval "rs.initiate()"
+#   MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0" python task_cache.py
+# Loads synthetic users, streams random task writes through TaskStore and checks
+# the cache matches a direct query, then compares window reads against Mongo.
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    arg_parser = argparse.ArgumentParser(description="Task cache check against a local replica set")
+    arg_parser.add_argument("--users", type=int, default=5000)
+    arg_parser.add_argument("--writes", type=int, default=2000)
+    arg_parser.add_argument("--storage", choices=("embedded", "collection"), default="embedded")
+    arg_parser.add_argument("--mode", choices=("auto", "changestream", "poll"), default="auto")
+    arg_parser.add_argument("--db", default="task_cache_check")
+    args = arg_parser.parse_args()
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017/?replicaSet=rs0")
+    os.environ.setdefault("MONGO_TLS", "false")
+    from bson import ObjectId
+
+    import data_access
+
+    rng = random.Random(0)
+
+    async def expected_pending(store: TaskStore, lo: datetime, hi: datetime) -> Dict[Any, datetime]:
+        return {task["_id"]: to_utc(task["due_date"])
+                async for user in store.users_with_tasks_due(lo, hi)
+                for task in user["tasks"] if not task.get("did_task") and lo <= to_utc(task["due_date"]) <= hi}
+
+    async def run() -> None:
+        client = data_access.create_client()
+        await client.drop_database(args.db)
+        db = client[args.db]
+        store = TaskStore(db, args.storage)
+        await store.ensure_indexes()
+
+        now = datetime.now(timezone.utc)
+        user_ids = [ObjectId() for _ in range(args.users)]
+        await db.users.insert_many([{"_id": user_id, "email": f"user{i}@example.com", "phone": "+15555550100",
+                                     "tasks": [], "updated_at": now} for i, user_id in enumerate(user_ids)])
+        task_ids: List[Tuple[Any, Any]] = []
+        for user_id in user_ids:
+            task_id = ObjectId()
+            await store.add(user_id, {"_id": task_id, "description": "synthetic task", "did_task": False,
+                                      "due_date": now + timedelta(hours=rng.uniform(-90, 160))})
+            task_ids.append((user_id, task_id))
+
+        cache = TaskCache(store, mode=args.mode, poll_interval=0.5)
+        await cache.start()
+        print(f"cache source: {cache.source}, {cache.stats()}")
+
+        # Random completions, re-openings and new tasks while the cache follows along
+        start = time.perf_counter()
+        for _ in range(args.writes):
+            action = rng.random()
+            if action < 0.4:
+                user_id, task_id = rng.choice(task_ids)
+                await store.set_did_task(user_id, task_id, rng.random() < 0.7)
+            elif action < 0.8:
+                user_id, task_id = rng.choice(task_ids)
+                await store.bulk_set_did_task([(user_id, task_id)], False)
+            else:
+                user_id = rng.choice(user_ids)
+                task_id = ObjectId()
+                await store.add(user_id, {"_id": task_id, "description": "new task", "did_task": False,
+                                          "due_date": now + timedelta(hours=rng.uniform(-90, 160))})
+                task_ids.append((user_id, task_id))
+        print(f"{args.writes} writes in {time.perf_counter() - start:.2f}s")
+        await asyncio.sleep(cache.poll_interval * 3 if cache.source == "poll" else 1.0)
+
+        lo, hi = now - timedelta(hours=84), now + timedelta(hours=72)
+        expected = await expected_pending(store, lo, hi)
+        cached = {task["_id"]: task["due_date"] async for user in cache.users_with_tasks_due(lo, hi)
+                  for task in user["tasks"]}
+        mismatched = len(set(expected.items()) ^ set(cached.items()))
+        print(f"window has {len(expected)} pending tasks in Mongo, {len(cached)} in cache, {mismatched} mismatched")
+
+        reads = 20
+        t0 = time.perf_counter()
+        for _ in range(reads):
+            [u async for u in store.users_with_tasks_due(lo, hi)]
+        mongo_ms = (time.perf_counter() - t0) / reads * 1000
+        t0 = time.perf_counter()
+        for _ in range(reads):
+            [u async for u in cache.users_with_tasks_due(lo, hi)]
+        cache_ms = (time.perf_counter() - t0) / reads * 1000
+        print(f"window read: Mongo {mongo_ms:.1f} ms, cache {cache_ms:.1f} ms")
+        print(f"cache stats: {cache.stats()}")
+
+        await cache.stop()
+        await client.drop_database(args.db)
+        await client.close()
+        if mismatched:
+            raise SystemExit(1)
+
+    asyncio.run(run())
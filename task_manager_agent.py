@@ -1,13 +1,20 @@
 """
-This agent handles restaurant table booking requests using a MongoDB Atlas database.
+This agent watches pending tasks in MongoDB Atlas and, as each task's due
+date approaches or passes, queues reminder texts, calls, charges and tweets
+for the other agents to send.
 """
 import os
-from datetime import datetime, timedelta, timezone
-from uagents import Agent, Model, Context, Protocol
-from pymongo.mongo_client import MongoClient
+from datetime import datetime, timezone
+from uagents import Agent, Model, Context
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
-from dateutil import parser  # Added for date parsing
+from uagents_core.types import DeliveryStatus
+from action_queue import ActionQueue, action_key
+from task_cache import TaskCache
+from task_scheduler import TaskScheduler
+from task_store import TaskStore
+from data_access import create_client
+from observability import start_logging
 
 load_dotenv()
 
@@ -24,17 +31,12 @@ MONGO_HOST_URL = os.environ.get("MONGO_HOST_URL")
 MONGO_PASSWORD_2 = os.environ.get("MONGO_PASSWORD_2")
 
 uri = f"mongodb+srv://{MONGO_USER}:{MONGO_PASSWORD_2}@{MONGO_HOST_URL}retryWrites=true&w=majority"
-print(uri)
-client = MongoClient(uri, server_api=ServerApi('1'))
+client = create_client(uri, server_api=ServerApi('1'))
 
 db = client.lahacks25
-users = db["users"]
-
-# Time thresholds for notifications (in hours)
-TEXT_THRESHOLDS = [72, 48, 24, 12, 6]  # 3 days, 2 days, 1 day, 12 hours, 6 hours
-CALL_THRESHOLDS = [2, 1, 0.83, 0.67, 0.5, 0.33, 0.17]  # 2 hours, 1 hour, 50 min, 40 min, 30 min, 20 min, 10 min
-CHARGE_THRESHOLDS = [0, 24, 48, 72]  # Due date, 1 day late, 2 days late, 3 days late
-TWEET_THRESHOLDS = [12, 36, 60, 84]  # 12 hours late, 1.5 days late, 2.5 days late, 3.5 days late
+tasks_store = TaskStore(db)
+# Pending tasks kept in memory and updated from a change stream, so ticks do not query Atlas
+task_cache = TaskCache(tasks_store)
 
 class Task(Model):
     name: str
@@ -55,102 +57,130 @@ class TweetRequest(Model):
     access_token: str
     access_token_secret: str
     text: str
+    task_id: str = ""
 
 class StripeChargeRequest(Model):
     email: str
 
-def check_time_threshold(task_due: datetime, threshold_hours: float) -> bool:
-    """Check if current time is within 10 minutes after a threshold time"""
-    now = datetime.now(timezone.utc)
-    threshold_time = task_due - timedelta(hours=threshold_hours)
-    time_diff = now - threshold_time
-    return 0 <= time_diff.total_seconds() <= 60  # 10 minutes in seconds
+class StripeChargeResult(Model):
+    email: str
+    success: bool
+    payment_intent: str = ""
+    error: str = ""
 
-def check_overdue_threshold(task_due: datetime, hours_overdue: float) -> bool:
-    """Check if current time is within 10 minutes after an overdue threshold time"""
-    now = datetime.now(timezone.utc)
-    threshold_time = task_due + timedelta(hours=hours_overdue)
-    time_diff = now - threshold_time
-    return 0 <= time_diff.total_seconds() <= 60  # 10 minutes in seconds
+def check_delivery(status, what: str):
+    """Raise so the action queue retries sends the agent could not deliver."""
+    if status is not None and status.status == DeliveryStatus.FAILED:
+        raise RuntimeError(f"{what} not delivered: {status.detail}")
 
 async def send_text(ctx: Context, phone_number: str, task_name: str, time_left: str):
     """Placeholder for sending text messages"""
-    print(f"Sending text to {phone_number}: 'Reminder: {task_name} is due in {time_left}'")
-    await ctx.send('agent1qt8n3t425wlld4rjm5xtcf6ahqdewzq3g64lnze85l7l0xlkdz6rwpa9krq', CallRequest(phone_number=phone_number,task=task_name,time_remaining=time_left))
+    ctx.logger.info(f"Sending text reminder for '{task_name}', due in {time_left}")
+    status = await ctx.send('agent1qt8n3t425wlld4rjm5xtcf6ahqdewzq3g64lnze85l7l0xlkdz6rwpa9krq', CallRequest(phone_number=phone_number,task=task_name,time_remaining=time_left))
+    check_delivery(status, "Text")
 
 async def make_call(ctx: Context, phone_number: str, task_name: str, time_left: str):
     """Placeholder for making calls"""
-    print(f"Calling {phone_number} about task '{task_name}' due in {time_left}")
-    await ctx.send('agent1qgap4rk8dnvhez4fcaxc4za2337scadkfc7frd3v2s2tc44aw2d8cejydw9', CallRequest(phone_number=phone_number,task=task_name,time_remaining=time_left))
+    ctx.logger.info(f"Requesting call about '{task_name}', due in {time_left}")
+    status = await ctx.send('agent1qgap4rk8dnvhez4fcaxc4za2337scadkfc7frd3v2s2tc44aw2d8cejydw9', CallRequest(phone_number=phone_number,task=task_name,time_remaining=time_left))
+    check_delivery(status, "Call")
 
-async def charge_user(ctx: Context, email: str):
+async def charge_user(ctx: Context, email: str, task_name: str, days_late: float):
     """Placeholder for charging users"""
-    print(f"Charging {phone_number} for task '{task_name}' - {days_late:.1f} days late")
-    await ctx.send('agent1q0ytn0q5lc6zm72288zewe8untpgutdjnjams00wwatdqnq6w9xgy69lstg', StripeChargeRequest(email=email))
+    ctx.logger.info(f"Requesting charge for '{task_name}', {days_late:.1f} days late")
+    status = await ctx.send('agent1q0ytn0q5lc6zm72288zewe8untpgutdjnjams00wwatdqnq6w9xgy69lstg', StripeChargeRequest(email=email))
+    check_delivery(status, "Charge")
 
-async def force_tweet(ctx: Context, access_token: str, access_token_secret: str, task_name: str):
+async def force_tweet(ctx: Context, access_token: str, access_token_secret: str, task_name: str, task_id: str = ""):
     """Placeholder for forcing tweets"""
-    print(f"Forcing user to tweet about task {task_name}")
-    await ctx.send('agent1qfhm6zhmms9eu7q7qjazvyva4jetc7n8hp8zw9ft5lef99fcfmxl6nj7kt4', TweetRequest(access_token=access_token, access_token_secret=access_token_secret, text=task_name))
+    ctx.logger.info(f"Requesting tweet about '{task_name}'")
+    # task_id lets the tweet agent use a tweet it generated ahead of time
+    status = await ctx.send('agent1qfhm6zhmms9eu7q7qjazvyva4jetc7n8hp8zw9ft5lef99fcfmxl6nj7kt4', TweetRequest(access_token=access_token, access_token_secret=access_token_secret, text=task_name, task_id=task_id))
+    check_delivery(status, "Tweet")
+
+# Refreshes apply the cache's changed tasks, so they can run on every tick; the
+# whole window is reloaded hourly
+scheduler = TaskScheduler(refresh_interval=60.0, full_refresh_interval=3600.0)
+
+# Ticks only queue actions; per-channel workers send them with retries
+actions = ActionQueue()
+actions.register("text", lambda ctx, p: send_text(ctx, p['phone'], p['task'], p['time_left']))
+actions.register("call", lambda ctx, p: make_call(ctx, p['phone'], p['task'], p['time_left']))
+actions.register("charge", lambda ctx, p: charge_user(ctx, p['email'], p['task'], p['days_late']))
+actions.register("tweet", lambda ctx, p: force_tweet(ctx, p['access_token'], p['access_token_secret'], p['task'], p['task_id']))
+
+@agent.on_event("startup")
+async def start_actions(ctx: Context):
+    await task_cache.start()
+    actions.start(ctx)
+
+@agent.on_event("shutdown")
+async def stop_actions(ctx: Context):
+    await actions.stop()
+    actions.close()
+    await task_cache.stop()
 
 @agent.on_interval(period=60.0)  # Check every minute
 async def check_tasks(ctx: Context):
-    """Check all tasks and send notifications if needed"""
+    """Queue the notifications that came due since the last tick"""
     now = datetime.now(timezone.utc)
-    
-    # Get all users
-    for user in users.find():
-        #print(user)
-        if user.get('tasks'):
-            for task in user.get('tasks'):
-                task_due = task['due_date']
-                if isinstance(task_due, str):
-                    task_due = parser.isoparse(task_due)
-                if task_due.tzinfo is None:
-                    task_due = task_due.replace(tzinfo=timezone.utc)
-                #print(task['description'])
-                time_left = task_due - now
-                
-                # Check text thresholds
-                for threshold in TEXT_THRESHOLDS:
-                    if check_time_threshold(task_due, threshold):
-                        time_str = f"{threshold} hours" if threshold < 24 else f"{threshold//24} days"
-                        await send_text(ctx, user['phone'], task['description'], time_str)
-                        break
-                        
-                # Check call thresholds
-                for threshold in CALL_THRESHOLDS:
-                    if check_time_threshold(task_due, threshold):
-                        time_str = f"{int(threshold*60)} minutes" if threshold < 1 else f"{int(threshold)} hours"
-                        await make_call(ctx, user['phone'], task['description'], time_str)
-                        break
-
-                # Check overdue thresholds (after due date)
-                if time_left.total_seconds() < 0:
-                    # Calculate how many 12-hour periods have passed
-                    hours_overdue = abs(time_left.total_seconds() / 3600)
-                    periods_passed = int(hours_overdue / 12)
-                    
-                    # Check if we're at a 12-hour mark
-                    if check_overdue_threshold(task_due, periods_passed * 12):
-                        # Charge every 24 hours (every 2 periods)
-                        if periods_passed % 2 == 0:
-                            days_late = (periods_passed * 12) / 24
-                            await charge_user(ctx, user['email'])
-                        
-                        # Force tweet every 12 hours
-                        #hours_late = periods_passed * 12
-
-                        if not user or 'twitter' not in user:
-                            raise ValueError(f"No twitter object for user")
-                        twitter = user['twitter']
-                        access_token = twitter.get('access_token')
-                        access_token_secret = twitter.get('access_token_secret')
-                        if not access_token or not access_token_secret:
-                            raise ValueError(f"No OAuth tokens found for user")
-
-                        await force_tweet(ctx, access_token, access_token_secret, task['description'])
+
+    if not task_cache.ready.is_set():
+        return
+
+    # Pick up new and changed tasks from the due-date window
+    if scheduler.needs_refresh(now):
+        await scheduler.refresh(task_cache, now)
+
+    # Claiming advances each task's persisted watermark, so a late tick catches up
+    # on every crossed threshold and no threshold is queued twice
+    for event in await scheduler.claim(tasks_store, scheduler.tick(now)):
+        user = event.user
+        task = event.task
+        threshold = event.threshold
+        task_id, due_ts = event.task_key
+        key = action_key(task_id, due_ts, event.kind, threshold)
+
+        if event.kind == "text":
+            time_str = f"{threshold} hours" if threshold < 24 else f"{threshold//24} days"
+            actions.enqueue("text", key, {"phone": user['phone'], "task": task['description'], "time_left": time_str})
+
+        elif event.kind == "call":
+            time_str = f"{int(threshold*60)} minutes" if threshold < 1 else f"{int(threshold)} hours"
+            actions.enqueue("call", key, {"phone": user['phone'], "task": task['description'], "time_left": time_str})
+
+        elif event.kind == "charge":
+            actions.enqueue("charge", key, {"email": user['email'], "task": task['description'], "days_late": threshold / 24})
+
+        elif event.kind == "tweet":
+            twitter = user.get('twitter')
+            if not twitter:
+                ctx.logger.warning(f"No twitter object for user {user['_id']}")
+                continue
+            access_token = twitter.get('access_token')
+            access_token_secret = twitter.get('access_token_secret')
+            if not access_token or not access_token_secret:
+                ctx.logger.warning(f"No OAuth tokens found for user {user['_id']}")
+                continue
+
+            actions.enqueue("tweet", key, {"access_token": access_token, "access_token_secret": access_token_secret,
+                                           "task": task['description'], "task_id": str(task_id)})
+
+@agent.on_message(model=StripeChargeResult)
+async def charge_result(ctx: Context, sender: str, result: StripeChargeResult):
+    """The stripe agent charges in the background and reports the outcome here"""
+    if result.success:
+        ctx.logger.info(f"Charged {result.email}: {result.payment_intent}")
+    else:
+        ctx.logger.error(f"Charge for {result.email} failed: {result.error}")
+
+@agent.on_interval(period=300.0)
+async def log_action_stats(ctx: Context):
+    ctx.logger.info(f"Actions: {actions.stats()} queued: {actions.depth()}")
+    ctx.logger.info(f"Task cache: {task_cache.stats()}")
 
 if __name__ == "__main__":
+    # Task cache and action queue records; uagents' own loggers keep their handlers
+    start_logging()
     agent.run()
     
\ No newline at end of file
@@ -0,0 +1,395 @@
+"""
+Due-date scheduler for the task manager agent.
+
+Instead of walking every user and every task on each tick, the scheduler
+precomputes when each task's reminders, calls, charges and tweets should fire
+and keeps those times in a min-heap. A tick only pops the events that are due.
+The heap is refreshed from the TaskStore with an index-backed due-date window,
+and only new or changed tasks get new events pushed. When the source can
+report what changed (TaskCache.drain_changes), most refreshes skip the window
+read: they only revisit the changed tasks and the tasks that just entered the
+window's leading edge, so their cost follows the write rate, not the number
+of pending tasks.
+
+Each task also carries a persisted watermark: the latest event time already
+fired for its current due date. Popped events are claimed by advancing that
+watermark with an atomic find_one_and_update, so a late tick catches up on
+every threshold it crossed, a restart resumes where the last process stopped,
+and overlapping ticks (or processes) never fire the same threshold twice.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from dateutil import parser
+
+# Time thresholds for notifications (in hours)
+TEXT_THRESHOLDS = [72, 48, 24, 12, 6]  # 3 days, 2 days, 1 day, 12 hours, 6 hours
+CALL_THRESHOLDS = [2, 1, 0.83, 0.67, 0.5, 0.33, 0.17]  # 2 hours, 1 hour, 50 min, 40 min, 30 min, 20 min, 10 min
+CHARGE_THRESHOLDS = [0, 24, 48, 72]  # Due date, 1 day late, 2 days late, 3 days late
+TWEET_THRESHOLDS = [12, 36, 60, 84]  # 12 hours late, 1.5 days late, 2.5 days late, 3.5 days late
+
+# Overdue tasks get a tweet every 12 hours until the last tweet threshold
+OVERDUE_PERIOD_HOURS = 12
+OVERDUE_TWEET_HOURS = list(range(0, max(TWEET_THRESHOLDS) + 1, OVERDUE_PERIOD_HOURS))
+
+# How far before / after the due date a task can still produce events
+MAX_LEAD_HOURS = max(TEXT_THRESHOLDS + CALL_THRESHOLDS)
+MAX_OVERDUE_HOURS = max(CHARGE_THRESHOLDS + OVERDUE_TWEET_HOURS)
+
+class ScheduledEvent(NamedTuple):
+    kind: str  # "text", "call", "charge" or "tweet"
+    threshold: float  # hours before (text/call) or after (charge/tweet) the due date
+    fire_at: float  # unix timestamp
+    task_key: Tuple[Any, float]  # (task _id, due timestamp) the event was built for
+    user: Dict[str, Any]
+    task: Dict[str, Any]
+
+
+def to_utc(value: Any) -> datetime:
+    """Normalize a stored due date (datetime or ISO string) to an aware UTC datetime."""
+    if isinstance(value, str):
+        value = parser.isoparse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def task_events(due: datetime) -> List[Tuple[str, float, float]]:
+    """Return every (kind, threshold, fire timestamp) for a task due at `due`."""
+    due_ts = due.timestamp()
+    events = []
+    for threshold in TEXT_THRESHOLDS:
+        events.append(("text", threshold, due_ts - threshold * 3600))
+    for threshold in CALL_THRESHOLDS:
+        events.append(("call", threshold, due_ts - threshold * 3600))
+    for threshold in CHARGE_THRESHOLDS:
+        events.append(("charge", threshold, due_ts + threshold * 3600))
+    for threshold in OVERDUE_TWEET_HOURS:
+        events.append(("tweet", threshold, due_ts + threshold * 3600))
+    return events
+
+
+class TaskScheduler:
+    """
+    Min-heap of upcoming task events.
+
+    Args:
+        refresh_interval: Seconds between Mongo refreshes. Events that fall
+            between two refreshes are still fired on the next tick, so a task
+            created shortly before a threshold is late rather than missed.
+        catch_up_hours: How far back the first refresh after a start looks,
+            so thresholds crossed while no process was running still fire:
+            from the watermark for tasks that have one, otherwise from this
+            far back.
+        full_refresh_interval: Seconds between full window reloads when the
+            source reports changes; these also forget tasks that left the
+            window.
+    """
+
+    def __init__(self, refresh_interval: float = 300.0, catch_up_hours: float = 6.0,
+                 full_refresh_interval: float = 3600.0):
+        self.refresh_interval = refresh_interval
+        self.catch_up_hours = catch_up_hours
+        self.full_refresh_interval = full_refresh_interval
+        self._heap: List[Tuple[float, int, ScheduledEvent]] = []
+        self._seq = itertools.count()
+        # task _id -> due timestamp of the version currently scheduled
+        self._tasks: Dict[Any, float] = {}
+        self._last_refresh: Optional[float] = None
+        self._last_full_refresh: Optional[float] = None
+        # Upper due-date bound of the last refresh; later ones only read past it
+        self._loaded_hi: Optional[datetime] = None
+        self._last_tick: Optional[float] = None
+        # (user _id, task _id, due timestamp, starting watermark) for tasks without a watermark yet
+        self._unmarked: List[Tuple[Any, Any, float, float]] = []
+        # Events dropped at claim time because another tick had already fired them
+        self.already_fired = 0
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def needs_refresh(self, now: datetime) -> bool:
+        return self._last_refresh is None or now.timestamp() - self._last_refresh >= self.refresh_interval
+
+    async def refresh(self, store: Any, now: datetime) -> int:
+        """
+        Reload pending tasks that can fire before the next refresh from a
+        TaskStore, or apply the changes a TaskCache recorded since last time.
+        """
+        # Keep tasks whose last event fell after the previous tick, even if a late
+        # tick means they just left the overdue window
+        if self._last_tick is not None:
+            since = datetime.fromtimestamp(min(self._last_tick, now.timestamp()), timezone.utc)
+        else:
+            since = now - timedelta(hours=self.catch_up_hours)
+        lo = since - timedelta(hours=MAX_OVERDUE_HOURS)
+        hi = now + timedelta(hours=MAX_LEAD_HOURS, seconds=self.refresh_interval)
+        # Always drain, so a full reload also clears what it already covers
+        changed = store.drain_changes() if hasattr(store, "drain_changes") else None
+        full = (changed is None or self._loaded_hi is None
+                or now.timestamp() - self._last_full_refresh >= self.full_refresh_interval)
+        if full:
+            users = [user async for user in store.users_with_tasks_due(lo, hi)]
+            pushed = self.load(users, now)
+            self._last_full_refresh = now.timestamp()
+            self.full_refreshes += 1
+        else:
+            users = [user async for user in store.users_with_tasks_due(self._loaded_hi, hi)]
+            users += [user async for user in store.users_with_changed_tasks(changed, lo, hi)]
+            pushed = self.load(users, now, changed=changed)
+            self.partial_refreshes += 1
+        self._loaded_hi = hi
+        await store.init_watermarks(self._unmarked)
+        self._unmarked = []
+        return pushed
+
+    def load(self, users: Iterable[Dict[str, Any]], now: datetime, changed: Optional[Set[Any]] = None) -> int:
+        """
+        Schedule events for the tasks in `users`.
+
+        Tasks already scheduled with the same due date are left alone; tasks
+        that disappeared, were completed or were rescheduled have their old
+        events dropped lazily when they reach the top of the heap.
+
+        By default `users` is the whole window and replaces what is scheduled.
+        With `changed`, it only holds those tasks (where still pending and in
+        the window) plus new ones, and every other scheduled task is kept.
+
+        Returns:
+            int: Number of events pushed
+        """
+        now_ts = now.timestamp()
+        # Events that crossed since the previous tick still fire; right after a
+        # start, tasks without a watermark catch up over the catch-up window
+        floor_ts = self._last_tick if self._last_tick is not None else now_ts - self.catch_up_hours * 3600
+        seen: Dict[Any, float] = {}
+        entries: List[Tuple[float, int, ScheduledEvent]] = []
+        for user in users:
+            tasks = user.get("tasks") or []
+            user_info = {k: user.get(k) for k in ("_id", "phone", "email", "twitter")}
+            for task in tasks:
+                if task.get("did_task"):
+                    continue
+                due = to_utc(task["due_date"])
+                due_ts = due.timestamp()
+                task_id = task["_id"]
+                if task_id in seen:
+                    continue
+                seen[task_id] = due_ts
+                if self._tasks.get(task_id) == due_ts:
+                    continue
+                task_info = {"_id": task_id, "description": task.get("description"), "due_date": due}
+                # Resume after the persisted watermark; otherwise start at the tick floor
+                fired_through = task.get("fired_through") if task.get("fired_due") == due_ts else None
+                if fired_through is None:
+                    self._unmarked.append((user_info["_id"], task_id, due_ts, floor_ts))
+                for kind, threshold, fire_at in task_events(due):
+                    if fired_through is not None and fire_at <= fired_through:
+                        continue
+                    if fired_through is None and fire_at < floor_ts:
+                        continue
+                    event = ScheduledEvent(kind, threshold, fire_at, (task_id, due_ts), user_info, task_info)
+                    entries.append((fire_at, next(self._seq), event))
+        # Bulk loads are cheaper to heapify than to push one by one
+        if len(entries) > len(self._heap):
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+        if changed is None:
+            self._tasks = seen
+        else:
+            for task_id in changed - seen.keys():
+                self._tasks.pop(task_id, None)
+            self._tasks.update(seen)
+        self._last_refresh = now_ts
+        return len(entries)
+
+    def tick(self, now: datetime) -> List[ScheduledEvent]:
+        """Pop every event due at or before `now`, skipping stale ones."""
+        now_ts = now.timestamp()
+        due: List[ScheduledEvent] = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            _, _, event = heapq.heappop(self._heap)
+            task_id, due_ts = event.task_key
+            if self._tasks.get(task_id) != due_ts:
+                continue
+            due.append(event)
+        self._last_tick = now_ts
+        return due
+
+    async def claim(self, store: Any, events: List[ScheduledEvent]) -> List[ScheduledEvent]:
+        """
+        Keep only the events this tick owns, advancing each task's watermark
+        past them. Events another tick or process already fired are dropped.
+        """
+        by_task: Dict[Tuple[Any, float], List[ScheduledEvent]] = {}
+        for event in events:
+            by_task.setdefault(event.task_key, []).append(event)
+
+        async def claim_task(task_key: Tuple[Any, float], group: List[ScheduledEvent]) -> List[ScheduledEvent]:
+            task_id, due_ts = task_key
+            through = max(event.fire_at for event in group)
+            # The owner's _id lets the embedded-mode claim use the users primary key
+            advanced, previous = await store.advance_watermark(group[0].user["_id"], task_id, due_ts, through)
+            owned = [e for e in group if advanced and (previous is None or e.fire_at > previous)]
+            self.already_fired += len(group) - len(owned)
+            return owned
+
+        claimed = await asyncio.gather(*(claim_task(key, group) for key, group in by_task.items()))
+        return sorted((event for owned in claimed for event in owned), key=lambda event: event.fire_at)
+
+
+# Benchmarks:
+#   --mode bench     tick cost should follow the number of due events, not the number of tasks
+#   --mode simulate  replay a week of ticks on a virtual clock with random lag, stalls,
+#                    overlapping processes and restarts, checking every threshold fires once
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    from bson import ObjectId
+
+    arg_parser = argparse.ArgumentParser(description="Task scheduler benchmarks")
+    arg_parser.add_argument("--mode", choices=("bench", "simulate"), default="bench")
+    arg_parser.add_argument("--users", type=int, default=None, help="default 100000 for bench, 2000 for simulate")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    start = datetime.now(timezone.utc)
+    rng = random.Random(args.seed)
+
+    def synthetic_users(count: int, span_s: float) -> List[Dict[str, Any]]:
+        return [{
+            "_id": ObjectId(),
+            "phone": "+15555550100",
+            "email": "user@example.com",
+            "tasks": [{
+                "_id": ObjectId(),
+                "description": "synthetic task",
+                "due_date": start + timedelta(seconds=rng.uniform(0, span_s)),
+                "did_task": False,
+            }],
+        } for _ in range(count)]
+
+    def bench() -> None:
+        users = synthetic_users(args.users or 100_000, 7 * 24 * 3600)
+        # Only events from the last minute count as already due, as for a running process
+        scheduler = TaskScheduler(catch_up_hours=1 / 60)
+        t0 = time.perf_counter()
+        pushed = scheduler.load(users, start)
+        print(f"Loaded {len(users)} users -> {pushed} events in {time.perf_counter() - t0:.2f}s")
+
+        print(f"{'step':>8} {'due events':>11} {'tick ms':>9} {'us/event':>9}")
+        now = start
+        for step in (1, 10, 60, 600, 3600, 6 * 3600):
+            now = now + timedelta(seconds=step)
+            t0 = time.perf_counter()
+            fired = scheduler.tick(now)
+            elapsed = time.perf_counter() - t0
+            per_event = elapsed / len(fired) * 1e6 if fired else 0.0
+            print(f"{step:>7}s {len(fired):>11} {elapsed * 1000:>9.3f} {per_event:>9.2f}")
+
+    class MemoryStore:
+        """TaskStore stand-in with the same watermark semantics, yielding between awaits."""
+
+        def __init__(self, users: List[Dict[str, Any]]):
+            self.users = users
+            self.tasks = {task["_id"]: task for user in users for task in user["tasks"]}
+
+        async def users_with_tasks_due(self, lo: datetime, hi: datetime):
+            for user in self.users:
+                tasks = [dict(t) for t in user["tasks"] if lo <= t["due_date"] <= hi and not t["did_task"]]
+                if tasks:
+                    yield {**user, "tasks": tasks}
+            await asyncio.sleep(0)
+
+        async def advance_watermark(self, user_id: Any, task_id: Any, due_ts: float, through_ts: float):
+            await asyncio.sleep(0)
+            task = self.tasks[task_id]
+            # Check and set without awaiting in between, like a single find_one_and_update
+            if task.get("fired_due") == due_ts and task["fired_through"] >= through_ts:
+                return False, None
+            previous = task.get("fired_through") if task.get("fired_due") == due_ts else None
+            task["fired_due"], task["fired_through"] = due_ts, through_ts
+            return True, previous
+
+        async def init_watermarks(self, marks):
+            await asyncio.sleep(0)
+            for _, task_id, due_ts, through_ts in marks:
+                task = self.tasks[task_id]
+                if task.get("fired_due") != due_ts:
+                    task["fired_due"], task["fired_through"] = due_ts, through_ts
+            return len(marks)
+
+    async def simulate() -> None:
+        week = 7 * 24 * 3600
+        users = synthetic_users(args.users or 2000, week)
+        store = MemoryStore(users)
+        fired: Dict[Tuple[Any, str, float], int] = {}
+        legacy: Dict[Tuple[Any, str, float], int] = {}
+
+        def legacy_tick(now_ts: float) -> None:
+            # Previous check_time_threshold / check_overdue_threshold: fire if now is within 60s after the threshold
+            for task in store.tasks.values():
+                for kind, threshold, fire_at in task_events(task["due_date"]):
+                    if 0 <= now_ts - fire_at < 60:
+                        key = (task["_id"], kind, threshold)
+                        legacy[key] = legacy.get(key, 0) + 1
+
+        async def process(name: str, offset: float) -> None:
+            """One task manager process ticking every minute with random lag, stalls and restarts."""
+            scheduler = TaskScheduler()
+            clock = start.timestamp() + offset
+            while clock < start.timestamp() + week:
+                lag = rng.expovariate(1 / 20)
+                if rng.random() < 0.002:
+                    lag += rng.uniform(600, 3 * 3600)  # a stalled scan or GC pause
+                if rng.random() < 0.001:
+                    scheduler = TaskScheduler()  # restart: in-memory heap and last tick are gone
+                    lag += rng.uniform(60, 1800)
+                clock += 60 + lag
+                now = datetime.fromtimestamp(clock, timezone.utc)
+                if scheduler.needs_refresh(now):
+                    await scheduler.refresh(store, now)
+                for event in await scheduler.claim(store, scheduler.tick(now)):
+                    key = (event.task_key[0], event.kind, event.threshold)
+                    fired[key] = fired.get(key, 0) + 1
+                if name == "a":
+                    legacy_tick(clock)
+                await asyncio.sleep(0)
+
+        t0 = time.perf_counter()
+        # Two processes whose ticks overlap, as with a rolling deploy or a duplicate agent
+        await asyncio.gather(process("a", 0.0), process("b", 17.0))
+        elapsed = time.perf_counter() - t0
+
+        end_ts = start.timestamp() + week
+        expected = {(task["_id"], kind, threshold)
+                    for task in store.tasks.values()
+                    for kind, threshold, fire_at in task_events(task["due_date"])
+                    if start.timestamp() <= fire_at <= end_ts - 4 * 3600}
+
+        def report(label: str, counts: Dict[Tuple[Any, str, float], int]) -> Tuple[int, int]:
+            missed = sum(1 for key in expected if key not in counts)
+            repeated = sum(1 for count in counts.values() if count > 1)
+            print(f"{label:<22} {len(expected):>7} expected, {missed:>6} missed, {repeated:>6} fired twice")
+            return missed, repeated
+
+        print(f"Simulated a week for {len(users)} tasks in {elapsed:.1f}s")
+        report("60s window (1 process)", legacy)
+        missed, repeated = report("watermarks (2 process)", fired)
+        if missed or repeated:
+            raise SystemExit(1)
+
+    if args.mode == "bench":
+        bench()
+    else:
+        asyncio.run(simulate())
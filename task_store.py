@@ -0,0 +1,368 @@
+"""
+Task storage for main.py and the scheduler agent.
+
+Tasks can live either embedded in `users.tasks` (the original layout) or in a
+dedicated `tasks` collection keyed by `user_id`. Set TASK_STORAGE=collection
+after running `python migrate_tasks.py` to switch. Both modes expose the same
+targeted queries so callers never load a whole user document to reach a task.
+The store expects an async database handle (see data_access.py).
+
+Task writes stamp `updated_at` on the task (and, in embedded mode, on the
+user document too) so task_cache.py can poll for changes where change streams
+are unavailable, and clients can fetch only the tasks changed since a time.
+"""
+import base64
+import binascii
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, UpdateOne
+
+TASK_STORAGE = os.getenv("TASK_STORAGE", "embedded")
+
+EMBEDDED = "embedded"
+COLLECTION = "collection"
+
+# User fields the notification paths need alongside a task
+USER_CONTACT_PROJECTION = {"_id": 1, "email": 1, "phone": 1, "twitter": 1}
+
+# Server-side timestamp for task writes, for the task cache's polling fallback
+TOUCH = {"$currentDate": {"updated_at": True}}
+
+# Per-task firing watermark: the due date version and the latest event time
+# (both unix seconds) the scheduler has already fired notifications through
+WATERMARK_FIELDS = ("fired_due", "fired_through")
+
+# Per-task stamp for embedded writes that target one task through the positional operator
+TOUCH_TASK = {"$currentDate": {"updated_at": True, "tasks.$.updated_at": True}}
+
+# Task fields returned by /tasks/{user_id}, with ObjectIds rendered as strings by the server
+TASK_API_PROJECTION = {
+    "_id": {"$toString": "$_id"},
+    "charity_id": {"$toString": "$charity_id"},
+    "description": 1,
+    "frequency": 1,
+    "donation_amount": 1,
+    "due_date": 1,
+    "did_task": 1,
+    "updated_at": 1,
+}
+
+# Task status filters for page_for_user
+PENDING = "pending"
+DONE = "done"
+
+# did_task filter for pending tasks in both storage modes; also matches tasks without the field
+NOT_DONE = {"$ne": True}
+
+# Task fields the donation pass needs
+DONATION_TASK_FIELDS = ("_id", "description", "charity_id", "donation_amount", "due_date", "frequency")
+
+
+def encode_cursor(after: Tuple[datetime, ObjectId]) -> str:
+    """Opaque page cursor for a (due_date, _id) key."""
+    due_date, task_id = after
+    if due_date.tzinfo is None:
+        due_date = due_date.replace(tzinfo=timezone.utc)
+    raw = orjson.dumps([round(due_date.timestamp() * 1000), str(task_id)])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        millis, task_id = orjson.loads(raw)
+        return datetime.fromtimestamp(millis / 1000, timezone.utc), ObjectId(task_id)
+    except (binascii.Error, orjson.JSONDecodeError, InvalidId, TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class TaskStore:
+    def __init__(self, db: Any, mode: str = TASK_STORAGE):
+        if mode not in (EMBEDDED, COLLECTION):
+            raise ValueError(f"Unknown TASK_STORAGE mode: {mode}")
+        self.db = db
+        self.mode = mode
+
+    async def ensure_indexes(self) -> None:
+        if self.mode == COLLECTION:
+            await self.db.tasks.create_index([("user_id", ASCENDING), ("due_date", ASCENDING), ("_id", ASCENDING)])
+            await self.db.tasks.create_index([("did_task", ASCENDING), ("due_date", ASCENDING)])
+            await self.db.tasks.create_index([("updated_at", ASCENDING)])
+        else:
+            await self.db.users.create_index([("tasks.due_date", ASCENDING)])
+        await self.db.users.create_index([("updated_at", ASCENDING)])
+
+    async def add(self, user_id: ObjectId, task_doc: Dict[str, Any]) -> bool:
+        """Store a new task for a user. Returns False if the user does not exist."""
+        task_doc = {**task_doc, "updated_at": datetime.now(timezone.utc)}
+        if self.mode == COLLECTION:
+            await self.db.tasks.insert_one({**task_doc, "user_id": user_id})
+            return True
+        result = await self.db.users.update_one({"_id": user_id}, {"$push": {"tasks": task_doc}, **TOUCH})
+        return result.modified_count > 0
+
+    async def list_for_user(self, user_id: ObjectId) -> Optional[List[Dict[str, Any]]]:
+        """Return a user's tasks, or None if the user does not exist."""
+        if self.mode == COLLECTION:
+            if not await self.db.users.find_one({"_id": user_id}, {"_id": 1}):
+                return None
+            cursor = self.db.tasks.find({"user_id": user_id}, {"user_id": 0}).sort("due_date", ASCENDING)
+            return await cursor.to_list(None)
+        user = await self.db.users.find_one({"_id": user_id}, {"tasks": 1})
+        return user.get("tasks", []) if user else None
+
+    async def page_for_user(
+        self,
+        user_id: ObjectId,
+        status: Optional[str] = None,
+        due_from: Optional[datetime] = None,
+        due_to: Optional[datetime] = None,
+        changed_since: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, ObjectId]] = None,
+        limit: int = 100,
+    ) -> Optional[Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, ObjectId]]]]:
+        """
+        Return one page of a user's tasks ordered by (due_date, _id), shaped
+        by TASK_API_PROJECTION, and the key to pass as `after` for the next
+        page (None on the last page). Returns None if the user does not exist.
+
+        Filtering, ordering and projection all run in MongoDB, so only the
+        page itself leaves the server.
+
+        Args:
+            status: PENDING or DONE, or None for both.
+            due_from, due_to: due_date window, from inclusive, to exclusive.
+            changed_since: only tasks whose updated_at is later than this.
+            after: (due_date, _id) of the last task of the previous page.
+        """
+        if self.mode == COLLECTION:
+            query: Dict[str, Any] = {"user_id": user_id}
+            if status == PENDING:
+                query["did_task"] = NOT_DONE
+            elif status == DONE:
+                query["did_task"] = True
+            due: Dict[str, Any] = {}
+            if due_from is not None:
+                due["$gte"] = due_from
+            if due_to is not None:
+                due["$lt"] = due_to
+            if due:
+                query["due_date"] = due
+            if changed_since is not None:
+                query["updated_at"] = {"$gt": changed_since}
+            if after is not None:
+                query["$or"] = [{"due_date": {"$gt": after[0]}}, {"due_date": after[0], "_id": {"$gt": after[1]}}]
+            cursor = self.db.tasks.find(query, TASK_API_PROJECTION).sort(
+                [("due_date", ASCENDING), ("_id", ASCENDING)]).limit(limit + 1)
+            tasks = await cursor.to_list(None)
+        else:
+            conditions: List[Dict[str, Any]] = []
+            if status == PENDING:
+                conditions.append({"$ne": ["$$this.did_task", True]})
+            elif status == DONE:
+                conditions.append({"$eq": ["$$this.did_task", True]})
+            if due_from is not None:
+                conditions.append({"$gte": ["$$this.due_date", due_from]})
+            if due_to is not None:
+                conditions.append({"$lt": ["$$this.due_date", due_to]})
+            if changed_since is not None:
+                conditions.append({"$gt": ["$$this.updated_at", changed_since]})
+            if after is not None:
+                conditions.append({"$or": [
+                    {"$gt": ["$$this.due_date", after[0]]},
+                    {"$and": [{"$eq": ["$$this.due_date", after[0]]}, {"$gt": ["$$this._id", after[1]]}]},
+                ]})
+            tasks_expr: Any = "$tasks"
+            if conditions:
+                tasks_expr = {"$filter": {"input": "$tasks", "cond": {"$and": conditions}}}
+            pipeline = [
+                {"$match": {"_id": user_id}},
+                {"$project": {"_id": 0, "tasks": tasks_expr}},
+                {"$unwind": "$tasks"},
+                {"$replaceRoot": {"newRoot": "$tasks"}},
+                {"$sort": {"due_date": 1, "_id": 1}},
+                {"$limit": limit + 1},
+                {"$project": TASK_API_PROJECTION},
+            ]
+            tasks = await (await self.db.users.aggregate(pipeline)).to_list(None)
+
+        # An empty page is also what a missing user looks like
+        if not tasks and not await self.db.users.find_one({"_id": user_id}, {"_id": 1}):
+            return None
+        if len(tasks) <= limit:
+            return tasks, None
+        del tasks[limit:]
+        return tasks, (tasks[-1]["due_date"], ObjectId(tasks[-1]["_id"]))
+
+    async def get(self, user_id: ObjectId, task_id: ObjectId) -> Optional[Dict[str, Any]]:
+        """Fetch a single task without loading the rest of the user's tasks."""
+        if self.mode == COLLECTION:
+            return await self.db.tasks.find_one({"_id": task_id, "user_id": user_id}, {"user_id": 0})
+        user = await self.db.users.find_one({"_id": user_id}, {"tasks": {"$elemMatch": {"_id": task_id}}})
+        if not user or not user.get("tasks"):
+            return None
+        return user["tasks"][0]
+
+    async def get_many(self, user_id: ObjectId, task_ids: List[ObjectId]) -> Optional[Dict[ObjectId, Dict[str, Any]]]:
+        """
+        Fetch several of a user's tasks with one query, keyed by task _id.
+        Returns None when none of them belongs to the user, which includes a
+        user that does not exist.
+        """
+        if self.mode == COLLECTION:
+            cursor = self.db.tasks.find({"_id": {"$in": task_ids}, "user_id": user_id}, {"user_id": 0})
+            tasks = {task["_id"]: task async for task in cursor}
+        else:
+            user = await self.db.users.find_one(
+                {"_id": user_id},
+                {"tasks": {"$filter": {"input": "$tasks", "cond": {"$in": ["$$this._id", task_ids]}}}}
+            )
+            tasks = {task["_id"]: task for task in (user or {}).get("tasks") or []}
+        return tasks or None
+
+    async def set_did_task(self, user_id: ObjectId, task_id: ObjectId, did_task: bool) -> Tuple[int, int]:
+        """Update one task's did_task flag. Returns (matched, modified) counts."""
+        if self.mode == COLLECTION:
+            result = await self.db.tasks.update_one(
+                {"_id": task_id, "user_id": user_id},
+                {"$set": {"did_task": did_task}, **TOUCH}
+            )
+        else:
+            result = await self.db.users.update_one(
+                {"_id": user_id, "tasks._id": task_id},
+                {"$set": {"tasks.$.did_task": did_task}, **TOUCH_TASK}
+            )
+        return result.matched_count, result.modified_count
+
+    async def iter_pending(self, batch_size: int = 1000) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Yield (user, task) for every task that is not done, streamed from a
+        single aggregation. `user` only carries `_id` and `email`.
+        """
+        if self.mode == EMBEDDED:
+            collection = self.db.users
+            pipeline = [
+                {"$match": {"tasks": {"$elemMatch": {"did_task": NOT_DONE}}}},
+                {"$project": {"email": 1, "tasks.did_task": 1, **{f"tasks.{f}": 1 for f in DONATION_TASK_FIELDS}}},
+                {"$unwind": "$tasks"},
+                {"$match": {"tasks.did_task": NOT_DONE}},
+                {"$project": {"user": {"_id": "$_id", "email": "$email"}, "task": "$tasks"}},
+            ]
+        else:
+            collection = self.db.tasks
+            pipeline = [
+                {"$match": {"did_task": NOT_DONE}},
+                {"$lookup": {
+                    "from": "users",
+                    "localField": "user_id",
+                    "foreignField": "_id",
+                    "pipeline": [{"$project": {"email": 1}}],
+                    "as": "user",
+                }},
+                {"$unwind": "$user"},
+                {"$project": {"user": 1, "task": {f: f"${f}" for f in DONATION_TASK_FIELDS}}},
+            ]
+        cursor = await collection.aggregate(pipeline, batchSize=batch_size)
+        async for doc in cursor:
+            yield doc["user"], doc["task"]
+
+    async def bulk_set_did_task(self, pairs: List[Tuple[ObjectId, ObjectId]], did_task: bool) -> int:
+        """
+        Set did_task on many (user_id, task_id) pairs in one bulk write.
+
+        Tasks whose flag already has that value are not written, so they keep
+        their updated_at and raise no change event. Returns how many changed.
+        """
+        if not pairs:
+            return 0
+        changed = {"$ne": did_task}
+        if self.mode == COLLECTION:
+            ops = [UpdateOne({"_id": task_id, "user_id": user_id, "did_task": changed},
+                             {"$set": {"did_task": did_task}, **TOUCH})
+                   for user_id, task_id in pairs]
+            result = await self.db.tasks.bulk_write(ops, ordered=False)
+        else:
+            ops = [UpdateOne({"_id": user_id, "tasks": {"$elemMatch": {"_id": task_id, "did_task": changed}}},
+                             {"$set": {"tasks.$.did_task": did_task}, **TOUCH_TASK})
+                   for user_id, task_id in pairs]
+            result = await self.db.users.bulk_write(ops, ordered=False)
+        return result.matched_count
+
+    async def users_with_tasks_due(self, lo: datetime, hi: datetime) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield user documents (contact fields plus a `tasks` list) for pending
+        tasks due between `lo` and `hi`.
+        """
+        if self.mode == EMBEDDED:
+            cursor = self.db.users.find(
+                {"tasks": {"$elemMatch": {"due_date": {"$gte": lo, "$lte": hi}, "did_task": NOT_DONE}}},
+                {**USER_CONTACT_PROJECTION, "tasks._id": 1, "tasks.description": 1,
+                 "tasks.due_date": 1, "tasks.did_task": 1, **{f"tasks.{f}": 1 for f in WATERMARK_FIELDS}}
+            )
+            async for user in cursor:
+                yield user
+            return
+        grouped: Dict[Any, List[Dict[str, Any]]] = {}
+        cursor = self.db.tasks.find(
+            {"did_task": NOT_DONE, "due_date": {"$gte": lo, "$lte": hi}},
+            {"user_id": 1, "description": 1, "due_date": 1, "did_task": 1, **{f: 1 for f in WATERMARK_FIELDS}}
+        )
+        async for task in cursor:
+            grouped.setdefault(task["user_id"], []).append(task)
+        async for user in self.db.users.find({"_id": {"$in": list(grouped)}}, USER_CONTACT_PROJECTION):
+            yield {**user, "tasks": grouped[user["_id"]]}
+
+    async def advance_watermark(self, user_id: Any, task_id: Any, due_ts: float,
+                                through_ts: float) -> Tuple[bool, Optional[float]]:
+        """
+        Atomically move a task's fired-through watermark forward to `through_ts`.
+
+        Returns (advanced, previous). When `advanced` is False another tick
+        already fired through this point and nothing should be sent. Otherwise
+        the caller owns every event after `previous`; `previous` is None when
+        nothing was fired yet for this due date.
+        """
+        unfired = {"$or": [{"fired_due": {"$ne": due_ts}}, {"fired_through": {"$lt": through_ts}}]}
+        if self.mode == COLLECTION:
+            before = await self.db.tasks.find_one_and_update(
+                {"_id": task_id, "user_id": user_id, **unfired},
+                {"$set": {"fired_due": due_ts, "fired_through": through_ts}},
+                projection={f: 1 for f in WATERMARK_FIELDS}
+            )
+        else:
+            user = await self.db.users.find_one_and_update(
+                {"_id": user_id, "tasks": {"$elemMatch": {"_id": task_id, **unfired}}},
+                {"$set": {"tasks.$.fired_due": due_ts, "tasks.$.fired_through": through_ts}},
+                projection={"tasks": {"$elemMatch": {"_id": task_id}}}
+            )
+            before = user["tasks"][0] if user and user.get("tasks") else None
+        if before is None:
+            return False, None
+        return True, before.get("fired_through") if before.get("fired_due") == due_ts else None
+
+    async def init_watermarks(self, marks: List[Tuple[Any, Any, float, float]]) -> int:
+        """
+        Give tasks seen for the first time (or with a new due date) a starting
+        watermark, from (user_id, task_id, due_ts, through_ts) tuples, so thresholds
+        crossed while the scheduler is down are caught up after a restart.
+        Tasks that already have a watermark for that due date are left alone.
+        """
+        if not marks:
+            return 0
+        if self.mode == COLLECTION:
+            ops = [UpdateOne({"_id": task_id, "user_id": user_id, "fired_due": {"$ne": due_ts}},
+                             {"$set": {"fired_due": due_ts, "fired_through": through_ts}})
+                   for user_id, task_id, due_ts, through_ts in marks]
+            result = await self.db.tasks.bulk_write(ops, ordered=False)
+        else:
+            ops = [UpdateOne({"_id": user_id, "tasks": {"$elemMatch": {"_id": task_id, "fired_due": {"$ne": due_ts}}}},
+                             {"$set": {"tasks.$.fired_due": due_ts, "tasks.$.fired_through": through_ts}})
+                   for user_id, task_id, due_ts, through_ts in marks]
+            result = await self.db.users.bulk_write(ops, ordered=False)
+        return result.modified_count
@@ -4,11 +4,11 @@ This agent attempts to book a restaurant table by sending requests
 
 import os
 import asyncio
-import aiohttp
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from uagents import Agent, Context, Model
 from pydantic import Field
+import agent_http
 
 load_dotenv()
 
@@ -19,6 +19,7 @@ class CallRequest(Model):
 
 # Initialize agent
 agent = Agent()
+agent_http.install(agent)
 
 # Configuration
 api_url = os.getenv('API_URL', 'https://e9f1-164-67-70-232.ngrok-free.app/send-message')
@@ -48,13 +49,12 @@ async def send_message(ctx: Context, sender: str, req: CallRequest):
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(api_url, json=request_data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    ctx.logger.info(result.get('message'))
-                else:
-                    ctx.logger.error(f"Failed to make call: {response.status}")
+        async with agent_http.get_session().post(api_url, json=request_data) as response:
+            if response.status == 200:
+                result = await response.json()
+                ctx.logger.info(result.get('message'))
+            else:
+                ctx.logger.error(f"Failed to make call: {response.status}")
     except Exception as e:
         ctx.logger.error(f"Error making call: {e}")
 
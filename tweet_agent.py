@@ -1,15 +1,24 @@
+import logging
 import os
-import json
-from uagents import Agent, Model, Context, Protocol
-from pymongo.mongo_client import MongoClient
+from datetime import datetime, timedelta, timezone
+from uagents import Agent, Model, Context
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
-import requests
+import agent_http
+import asi1_stream
+from data_access import create_client
+from observability import fields, start_logging
+from task_scheduler import MAX_OVERDUE_HOURS
+from task_store import TaskStore
+from tweet_pool import TweetPool
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 # Initialize agent
 agent = Agent()
+agent_http.install(agent)
 
 # For this example, you will need to set up an account and database on MongoDB Atlas:
 # https://www.mongodb.com/atlas/database. Once you have done so, enter your details
@@ -19,74 +28,93 @@ agent = Agent()
 MONGO_USER = os.environ.get("MONGO_USER")
 MONGO_HOST_URL = os.environ.get("MONGO_HOST_URL")
 MONGO_PASSWORD_2 = os.environ.get("MONGO_PASSWORD_2")
-ASI1_API_KEY = os.getenv("ASI1_API_KEY")
-ASI1_API_URL = "https://api.asi1.ai/v1/chat/completions"
 
 api_url = os.getenv('API_URL', f'{os.getenv("NGROK_URL")}/tweet')
 uri = f"mongodb+srv://{MONGO_USER}:{MONGO_PASSWORD_2}@{MONGO_HOST_URL}retryWrites=true&w=majority"
-print(uri)
-client = MongoClient(uri, server_api=ServerApi('1'))
+client = create_client(uri, server_api=ServerApi('1'))
 
 db = client.lahacks25
-users = db["users"]
+tasks_store = TaskStore(db)
+
+# Tweets are pre-generated for tasks due within this many hours, and still overdue ones
+TWEET_POOL_LEAD_HOURS = float(os.getenv("TWEET_POOL_LEAD_HOURS", 24))
+TWEET_POOL_REFRESH = float(os.getenv("TWEET_POOL_REFRESH", 300))
 
 class TweetRequest(Model):
     access_token: str
     access_token_secret: str
     text: str
+    task_id: str = ""
+
+def tweet_prompt(task_description: str) -> str:
+    return (
+        f"I failed to complete a task on time. Generate pure text with no quotation marks that could be tweeted that is a few sentences long that is extremely self deprecating because of this. Should not be funny, just very rude to myself. Generate only the tweet and no other text. Make sure it is purely text and is not surrounded by quotation marks. Make sure to mention the task that I failed to complete: {task_description}"
+    )
+
+async def generate_tweet_text(task_description: str) -> str:
+    tweet_text, stats = await asi1_stream.stream_completion_async(tweet_prompt(task_description), agent_http.get_session())
+    # Pool fills run outside a handler, so there is no ctx.logger here
+    log.info("Generated %d char tweet, first token after %.2fs", stats.chars, stats.first_token_s or 0,
+             extra=fields(chars=stats.chars, first_token_s=stats.first_token_s, total_s=stats.total_s))
+    return tweet_text
+
+tweet_pool = TweetPool(generate_tweet_text)
+
+@agent.on_interval(period=TWEET_POOL_REFRESH)
+async def refresh_tweet_pool(ctx: Context):
+    """
+    Keep tweets ready for every pending task that can go overdue soon, and drop
+    the ones for tasks that were completed or are past their last tweet.
+    """
+    now = datetime.now(timezone.utc)
+    lo = now - timedelta(hours=MAX_OVERDUE_HOURS)
+    hi = now + timedelta(hours=TWEET_POOL_LEAD_HOURS)
+    pending = []
+    async for user in tasks_store.users_with_tasks_due(lo, hi):
+        twitter = user.get('twitter') or {}
+        if not twitter.get('access_token') or not twitter.get('access_token_secret'):
+            continue
+        for task in user['tasks']:
+            due = task['due_date']
+            if due.tzinfo is None:
+                due = due.replace(tzinfo=timezone.utc)
+            # Embedded mode returns every task of a matching user
+            if task.get('did_task') or not lo <= due <= hi:
+                continue
+            pending.append((due, str(task['_id']), task['description']))
+    pending.sort(key=lambda item: item[0])
+    tweet_pool.sync((task_id, description) for _, task_id, description in pending)
+    ctx.logger.info(f"Tweet pool: {tweet_pool.stats()}")
 
 @agent.on_message(model=TweetRequest)
 async def generate_tweet(ctx: Context, sender: str, req: TweetRequest):
     """
     Generate a tweet by streaming from the ASI1 Mini model. 
     """
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {ASI1_API_KEY}'
-    }
-    payload = {
-        "model": "asi1-mini",
-        "messages": [{"role": "user", "content": (
-            f"I failed to complete a task on time. Generate pure text with no quotation marks that could be tweeted that is a few sentences long that is extremely self deprecating because of this. Should not be funny, just very rude to myself. Generate only the tweet and no other text. Make sure it is purely text and is not surrounded by quotation marks. Make sure to mention the task that I failed to complete: {req.text}"
-        )}],
-        "temperature": 0.7,
-        "stream": True,
-        "max_tokens": 280
-    }
-    response = requests.post(
-        ASI1_API_URL,
-        headers=headers,
-        data=json.dumps(payload),
-        stream=True
-    )
-    tweet_text = ""
-    for chunk in response.iter_lines():
-        if not chunk:
-            continue
-        if chunk.startswith(b"data: "):
-            payload_chunk = chunk[len(b"data: "):]
-            if payload_chunk == b"[DONE]":
-                break
-            data = json.loads(payload_chunk)
-            delta = data["choices"][0].get("delta", {})
-            content = delta.get("content")
-            if content:
-                tweet_text += content
-    #req.text = tweet_text.strip()
+    if not agent_http.run_in_background(ctx, generate_and_post_tweet(ctx, req)):
+        ctx.logger.warning(f"Too many tweets in flight, dropping tweet for task {req.task_id or req.text}")
+
+async def generate_and_post_tweet(ctx: Context, req: TweetRequest):
+    tweet_text = tweet_pool.take(req.task_id) if req.task_id else None
+    if tweet_text is None:
+        # Not pre-generated (new task, pool still filling, or an older sender without task_id)
+        tweet_text, stats = await asi1_stream.stream_completion_async(tweet_prompt(req.text), agent_http.get_session())
+        ctx.logger.info(f"Generated {stats.chars} char tweet, first token after {stats.first_token_s or 0:.2f}s")
 
     # Send the generated tweet to the /tweet API endpoint
     tweet_payload = {
         "access_token": req.access_token,
         "access_token_secret": req.access_token_secret,
-        "tweet": tweet_text.strip()
+        "tweet": tweet_text
     }
-    api_response = requests.post(api_url, json=tweet_payload)
-    if api_response.status_code == 200:
-        ctx.logger.info("Tweet sent to API successfully!")
-    else:
-        ctx.logger.error(f"Failed to send tweet to API: {api_response.text}")
+    async with agent_http.get_session().post(api_url, json=tweet_payload) as api_response:
+        if api_response.status == 200:
+            ctx.logger.info("Tweet sent to API successfully!")
+        else:
+            ctx.logger.error(f"Failed to send tweet to API: {await api_response.text()}")
 
 if __name__ == "__main__":
+    # Pool fill records; uagents' own loggers keep their handlers
+    start_logging()
     agent.run()
     
\ No newline at end of file
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Pre-generated shame tweets, kept ready per task before it goes overdue.
+
+Generating a tweet takes seconds, and overdue tasks tend to arrive in bursts
+at the top of the hour. The pool generates tweets for tasks approaching
+their due date in the background, so the overdue path only pops a ready
+tweet and posts it. Refills run with bounded concurrency; tasks that were
+completed or left the due-date window are evicted on the next sync.
+
+    TWEET_POOL_SIZE         tweets kept ready per task (default 2)
+    TWEET_POOL_MAX_TASKS    tasks pooled at once, soonest due first (default 5000)
+    TWEET_POOL_CONCURRENCY  generations running at once (default 4)
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from observability import fields
+
+TWEET_POOL_SIZE = int(os.getenv("TWEET_POOL_SIZE", 2))
+TWEET_POOL_MAX_TASKS = int(os.getenv("TWEET_POOL_MAX_TASKS", 5000))
+TWEET_POOL_CONCURRENCY = int(os.getenv("TWEET_POOL_CONCURRENCY", 4))
+
+log = logging.getLogger(__name__)
+
+
+class TweetPool:
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[str]],
+        size: int = TWEET_POOL_SIZE,
+        max_tasks: int = TWEET_POOL_MAX_TASKS,
+        concurrency: int = TWEET_POOL_CONCURRENCY,
+    ):
+        self.generate = generate
+        self.size = size
+        self.max_tasks = max_tasks
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # task id -> (description the tweets were written for, ready tweets)
+        self._tweets: Dict[str, Tuple[str, Deque[str]]] = {}
+        self._refills: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.evicted = 0
+        self.failures = 0
+
+    def __len__(self) -> int:
+        return sum(len(tweets) for _, tweets in self._tweets.values())
+
+    def take(self, task_id: str) -> Optional[str]:
+        """Pop a ready tweet for the task and start refilling its slot."""
+        entry = self._tweets.get(task_id)
+        if entry is None or not entry[1]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        tweet = entry[1].popleft()
+        self._start_refill(task_id)
+        return tweet
+
+    def sync(self, active: Iterable[Tuple[str, str]]) -> None:
+        """
+        Make the pool match the tasks that may tweet soon.
+
+        Args:
+            active: (task id, description) pairs, most urgent first. Tasks
+                not listed (completed, deleted or past their last tweet) are
+                evicted; only the first max_tasks are pooled.
+        """
+        wanted: Dict[str, str] = {}
+        for task_id, description in active:
+            if len(wanted) >= self.max_tasks:
+                break
+            wanted[task_id] = description
+
+        for task_id in [t for t in self._tweets if t not in wanted]:
+            self.evict(task_id)
+
+        for task_id, description in wanted.items():
+            entry = self._tweets.get(task_id)
+            if entry is None or entry[0] != description:
+                if entry is not None:
+                    self.evict(task_id)
+                self._tweets[task_id] = (description, deque())
+            self._start_refill(task_id)
+
+    def evict(self, task_id: str) -> None:
+        if self._tweets.pop(task_id, None) is not None:
+            self.evicted += 1
+        refill = self._refills.pop(task_id, None)
+        if refill is not None:
+            refill.cancel()
+
+    def _start_refill(self, task_id: str) -> None:
+        entry = self._tweets.get(task_id)
+        if entry is None or len(entry[1]) >= self.size or task_id in self._refills:
+            return
+        task = asyncio.create_task(self._refill(task_id))
+        self._refills[task_id] = task
+        task.add_done_callback(lambda _: self._refills.pop(task_id, None)
+                               if self._refills.get(task_id) is task else None)
+
+    async def _refill(self, task_id: str) -> None:
+        while True:
+            entry = self._tweets.get(task_id)
+            if entry is None or len(entry[1]) >= self.size:
+                return
+            description, tweets = entry
+            async with self._semaphore:
+                try:
+                    tweet = await self.generate(description)
+                except Exception as e:
+                    self.failures += 1
+                    log.warning("Tweet pre-generation failed: %s", e, extra=fields(task_id=task_id))
+                    return
+            # The task may have been evicted or rewritten while we waited
+            if self._tweets.get(task_id) is not entry:
+                return
+            if tweet:
+                tweets.append(tweet)
+                self.generated += 1
+
+    async def wait_idle(self) -> None:
+        """Wait until no refills are running (for tests and benchmarks)."""
+        while self._refills:
+            await asyncio.gather(*list(self._refills.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tasks": len(self._tweets),
+            "ready": len(self),
+            "refilling": len(self._refills),
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "evicted": self.evicted,
+            "failures": self.failures,
+        }
+
+
+# Simulation: an hourly burst of overdue tasks with on-demand vs pooled generation
+if __name__ == "__main__":
+    import time
+
+    GENERATION_S = 2.0
+    BURST = 200
+
+    async def fake_generate(description: str) -> str:
+        await asyncio.sleep(GENERATION_S)
+        return f"I failed to {description}."
+
+    async def post(tweet: str) -> None:
+        await asyncio.sleep(0.05)
+
+    async def run() -> None:
+        tasks = [(f"task{i}", f"task number {i}") for i in range(BURST)]
+
+        # Previous path: every overdue task generates, limited like the pool, then posts
+        semaphore = asyncio.Semaphore(TWEET_POOL_CONCURRENCY * 4)
+
+        async def on_demand(description: str) -> float:
+            start = time.perf_counter()
+            async with semaphore:
+                tweet = await fake_generate(description)
+            await post(tweet)
+            return time.perf_counter() - start
+
+        latencies = sorted(await asyncio.gather(*(on_demand(d) for _, d in tasks)))
+        print(f"on demand: p50 {latencies[BURST // 2]:.2f}s, max {latencies[-1]:.2f}s per overdue tweet")
+
+        pool = TweetPool(fake_generate, size=2, concurrency=TWEET_POOL_CONCURRENCY * 4)
+        start = time.perf_counter()
+        pool.sync(tasks)
+        await pool.wait_idle()
+        print(f"pre-generated {len(pool)} tweets for {BURST} tasks in {time.perf_counter() - start:.1f}s "
+              f"ahead of the due date")
+
+        async def pooled(task_id: str) -> float:
+            start = time.perf_counter()
+            tweet = pool.take(task_id)
+            await post(tweet)
+            return time.perf_counter() - start
+
+        latencies = sorted(await asyncio.gather(*(pooled(t) for t, _ in tasks)))
+        print(f"pooled:    p50 {latencies[BURST // 2]:.2f}s, max {latencies[-1]:.2f}s per overdue tweet")
+
+        # Half the tasks get completed; the next sync evicts them
+        pool.sync(tasks[::2])
+        await pool.wait_idle()
+        print(f"after completing half: {pool.stats()}")
+
+    asyncio.run(run())
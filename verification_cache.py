@@ -0,0 +1,170 @@
+"""
+Verification-result cache keyed by task description and a perceptual hash.
+
+Photos are fingerprinted with a 64-bit dHash, so re-encoded, resized or
+slightly cropped resubmissions land within a few bits of each other. Lookups
+split the hash into eight 8-bit bands: any two hashes within 7 bits share at
+least one band, so only photos in matching band buckets are compared.
+
+    VERIFICATION_CACHE_SIZE          in-memory entries (default 10000)
+    VERIFICATION_CACHE_TTL           seconds a verdict stays valid (default 86400)
+    VERIFICATION_CACHE_MAX_DISTANCE  Hamming distance treated as the same photo (default 6)
+    VERIFICATION_CACHE_PERSIST       "true" to add the Mongo-backed tier
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from pymongo import ASCENDING
+
+VERIFICATION_CACHE_SIZE = int(os.getenv("VERIFICATION_CACHE_SIZE", 10000))
+VERIFICATION_CACHE_TTL = float(os.getenv("VERIFICATION_CACHE_TTL", 24 * 3600))
+VERIFICATION_CACHE_MAX_DISTANCE = int(os.getenv("VERIFICATION_CACHE_MAX_DISTANCE", 6))
+VERIFICATION_CACHE_PERSIST = os.getenv("VERIFICATION_CACHE_PERSIST", "false").lower() == "true"
+
+BANDS = 8
+
+
+def dhash(image: bytes) -> int:
+    """64-bit difference hash of an encoded image."""
+    # OpenCV and NumPy are imported on first use so importing the app stays fast
+    import cv2
+    import numpy as np
+
+    gray = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        raise ValueError("Could not decode image for hashing")
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def hash_bands(h: int) -> List[int]:
+    """Band values tagged with their position so different bands never collide."""
+    return [(i << 8) | ((h >> (8 * i)) & 0xFF) for i in range(BANDS)]
+
+
+class CacheResult(NamedTuple):
+    verdict: Optional[bool]  # None on a miss
+    reused_by: List[Tuple[str, str]]  # other (user_id, task_id) pairs that submitted this photo
+
+
+class VerificationCache:
+    def __init__(
+        self,
+        max_entries: int = VERIFICATION_CACHE_SIZE,
+        ttl: float = VERIFICATION_CACHE_TTL,
+        max_distance: int = VERIFICATION_CACHE_MAX_DISTANCE,
+        collection: Any = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.collection = collection
+        # (description, hash) -> {"verdict", "expires_at", "user_id", "task_id"}
+        self._entries: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[int, Set[Tuple[str, int]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self) -> None:
+        if self.collection is None:
+            return
+        await self.collection.create_index([("bands", ASCENDING)])
+        await self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    async def lookup(self, description: str, photo_hash: int, user_id: str, task_id: str) -> CacheResult:
+        description = description.strip().lower()
+        now = time.time()
+        verdict: Optional[bool] = None
+        reused: Set[Tuple[str, str]] = set()
+
+        for key in self._candidates(photo_hash):
+            entry = self._entries[key]
+            if entry["expires_at"] <= now:
+                self._evict(key)
+                continue
+            if hamming(key[1], photo_hash) > self.max_distance:
+                continue
+            if (entry["user_id"], entry["task_id"]) != (user_id, task_id):
+                reused.add((entry["user_id"], entry["task_id"]))
+            if key[0] == description and verdict is None:
+                verdict = entry["verdict"]
+                self._entries.move_to_end(key)
+
+        if verdict is None and self.collection is not None:
+            verdict = await self._lookup_persistent(description, photo_hash, user_id, task_id, reused)
+
+        if verdict is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return CacheResult(verdict, sorted(reused))
+
+    async def store(self, description: str, photo_hash: int, verdict: bool, user_id: str, task_id: str) -> None:
+        description = description.strip().lower()
+        self._put(description, photo_hash, verdict, user_id, task_id, time.time() + self.ttl)
+        if self.collection is not None:
+            await self.collection.update_one(
+                {"description": description, "hash": f"{photo_hash:016x}"},
+                {"$set": {
+                    "bands": hash_bands(photo_hash),
+                    "verdict": verdict,
+                    "user_id": user_id,
+                    "task_id": task_id,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl),
+                }},
+                upsert=True,
+            )
+
+    def _candidates(self, photo_hash: int) -> Set[Tuple[str, int]]:
+        keys: Set[Tuple[str, int]] = set()
+        for band in hash_bands(photo_hash):
+            keys |= self._buckets.get(band, set())
+        return keys
+
+    def _put(self, description: str, photo_hash: int, verdict: bool, user_id: str, task_id: str,
+             expires_at: float) -> None:
+        key = (description, photo_hash)
+        if key not in self._entries:
+            for band in hash_bands(photo_hash):
+                self._buckets.setdefault(band, set()).add(key)
+        self._entries[key] = {"verdict": verdict, "expires_at": expires_at, "user_id": user_id, "task_id": task_id}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: Tuple[str, int]) -> None:
+        self._entries.pop(key, None)
+        for band in hash_bands(key[1]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    async def _lookup_persistent(self, description: str, photo_hash: int, user_id: str, task_id: str,
+                                 reused: Set[Tuple[str, str]]) -> Optional[bool]:
+        verdict: Optional[bool] = None
+        cursor = self.collection.find(
+            {"bands": {"$in": hash_bands(photo_hash)}, "expires_at": {"$gt": datetime.utcnow()}}
+        ).limit(100)
+        async for doc in cursor:
+            stored_hash = int(doc["hash"], 16)
+            if hamming(stored_hash, photo_hash) > self.max_distance:
+                continue
+            if (doc["user_id"], doc["task_id"]) != (user_id, task_id):
+                reused.add((doc["user_id"], doc["task_id"]))
+            if doc["description"] == description and verdict is None:
+                verdict = doc["verdict"]
+                # Promote into the in-memory tier
+                remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+                self._put(description, stored_hash, verdict, doc["user_id"], doc["task_id"],
+                          time.time() + remaining)
+        return verdict
@@ -205,49 +205,72 @@ export const getCharities = async () => {
 };
 
 /**
- * Fetch tasks for a user
+ * Fetch tasks for a user, following the server's page cursors
  * @param {string} userId - User's ID
+ * @param {Object} filters - Optional query filters
+ * @param {string} filters.status - 'pending' or 'done'
+ * @param {string} filters.due_from - ISO date, inclusive
+ * @param {string} filters.due_to - ISO date, exclusive
+ * @param {string} filters.changed_since - ISO date; only tasks changed after it
  * @returns {Promise<Array>} List of tasks
  */
-export const getUserTasks = async (userId) => {
+export const getUserTasks = async (userId, filters = {}) => {
   try {
-    const response = await fetch(`${API_BASE_URL}/tasks/${userId}`, {
-      method: 'GET',
-      headers: {
-        'Accept': 'application/json'
+    const tasks = [];
+    let cursor = null;
+    do {
+      const params = new URLSearchParams(filters);
+      if (cursor) {
+        params.set('cursor', cursor);
       }
-    });
+      const page = await getUserTasksPage(userId, params);
+      tasks.push(...page.tasks);
+      cursor = page.nextCursor;
+    } while (cursor);
+    return tasks;
+  } catch (error) {
+    console.error('API Error:', error);
+    throw error;
+  }
+};
 
-    if (!response.ok) {
-      let errorMessage;
-      const contentType = response.headers.get('content-type');
-      
-      if (contentType && contentType.includes('application/json')) {
-        try {
-          const errorData = await response.json();
-          errorMessage = errorData.detail || JSON.stringify(errorData);
-        } catch (parseError) {
-          errorMessage = `Error ${response.status}: Could not parse error response`;
-        }
-      } else {
-        try {
-          errorMessage = await response.text();
-        } catch (textError) {
-          errorMessage = `Error ${response.status}: ${response.statusText}`;
-        }
-      }
+const getUserTasksPage = async (userId, params) => {
+  const response = await fetch(`${API_BASE_URL}/tasks/${userId}?${params.toString()}`, {
+    method: 'GET',
+    headers: {
+      'Accept': 'application/json'
+    }
+  });
 
-      const error = new Error(errorMessage);
-      error.status = response.status;
-      error.statusText = response.statusText;
-      throw error;
+  if (!response.ok) {
+    let errorMessage;
+    const contentType = response.headers.get('content-type');
+    
+    if (contentType && contentType.includes('application/json')) {
+      try {
+        const errorData = await response.json();
+        errorMessage = errorData.detail || JSON.stringify(errorData);
+      } catch (parseError) {
+        errorMessage = `Error ${response.status}: Could not parse error response`;
+      }
+    } else {
+      try {
+        errorMessage = await response.text();
+      } catch (textError) {
+        errorMessage = `Error ${response.status}: ${response.statusText}`;
+      }
     }
 
-    return await response.json();
-  } catch (error) {
-    console.error('API Error:', error);
+    const error = new Error(errorMessage);
+    error.status = response.status;
+    error.statusText = response.statusText;
     throw error;
   }
+
+  return {
+    tasks: await response.json(),
+    nextCursor: response.headers.get('X-Next-Cursor'),
+  };
 };
 
 /**